@@ -7,8 +7,8 @@ import numpy as np
 import pandas as pd
 import joblib
 import os
-from datetime import datetime
 import subprocess
+import threading
 import logging
 
 app = FastAPI(title="SDPDIAP ML Service", version="1.0.0")
@@ -33,12 +33,29 @@ class DistrictState(BaseModel):
     avg_deprivation_time: float
     road_access: str
 
+    @staticmethod
+    def to_table(states: List["DistrictState"]):
+        """Columnar DistrictStateTable (one episode) shared with the simulation engine and policies"""
+        from simulate.district_state import DistrictStateTable
+        return DistrictStateTable.from_records([state.model_dump() for state in states])
+
+    @classmethod
+    def from_table(cls, table, episode: int = 0) -> List["DistrictState"]:
+        """API models for one episode of a DistrictStateTable"""
+        return [cls(**record) for record in table.to_records(episode)]
+
 class ForecastRequest(BaseModel):
     district_ids: List[str]
     horizon: int = 6
 
+class DistrictForecast(BaseModel):
+    mean: float
+    var: float
+    quantiles: Dict[str, float] = {}
+    surge_prob: float = 0.0
+
 class ForecastResponse(BaseModel):
-    forecasts: Dict[str, Dict[str, float]]
+    forecasts: Dict[str, DistrictForecast]
 
 class VFARequest(BaseModel):
     post_decision_state: Dict[str, Any]
@@ -54,26 +71,107 @@ class OptimizeRequest(BaseModel):
     vfa_estimates: Dict[str, float]
     fleet: List[Dict[str, Any]]
     constraints: Optional[Dict[str, Any]] = {}
+    method: str = "auto"
+    time_limit_s: Optional[float] = None
+    relative_gap: Optional[float] = None
+    forecasts: Optional[Dict[str, DistrictForecast]] = None
+    n_scenarios: Optional[int] = None
 
 class OptimizeResponse(BaseModel):
     allocations: List[Dict[str, Any]]
     objective: float
     solve_info: Dict[str, Any]
 
+class OptimizeBatchRequest(BaseModel):
+    requests: List[OptimizeRequest]
+    # Chunks solved side by side, capped at the batch pool's size (None for the whole pool)
+    n_workers: Optional[int] = None
+
+class OptimizeBatchResponse(BaseModel):
+    results: List[OptimizeResponse]
+
 class SimulateRequest(BaseModel):
     scenario: str
     policy: str = "dl_vfa"
     n_episodes: int = 10
+    vectorized: bool = False
+    n_workers: Optional[int] = None
+    output_format: str = "parquet"
+    # Adaptive mode: n_episodes becomes the budget and the run stops once the
+    # confidence interval of the mean target_metric is this narrow
+    target_half_width: Optional[float] = None
+    target_metric: str = "total_cost"
 
 class SimulateResponse(BaseModel):
-    results_summary: Dict[str, float]
+    results_summary: Dict[str, Any]
     output_file: str
 
+class JobResponse(BaseModel):
+    job_id: str
+    kind: str
+    status: str
+    progress: int
+    total: int
+    created_at: str
+    started_at: Optional[str] = None
+    finished_at: Optional[str] = None
+    error: Optional[str] = None
+
+    @classmethod
+    def from_job(cls, job: Dict[str, Any]) -> "JobResponse":
+        return cls(job_id=job["id"], **{k: job[k] for k in cls.model_fields if k != "job_id"})
+
 # Global model storage
 models = {}
 artifacts_dir = "./artifacts"
 data_dir = "./data"
 
+# Background simulation jobs, created on first use
+job_queue = None
+
+# Road network of the optimize endpoints, loaded once so its route cache
+# persists across requests; reloaded when the network file changes
+road_network = None
+road_network_version = None
+road_network_lock = threading.Lock()
+
+def get_road_network():
+    """Shared road network of this service process (None when none is configured)"""
+    global road_network, road_network_version
+    from simulate.routing import ROAD_NETWORK_JSON, load_road_network
+    try:
+        stat = os.stat(ROAD_NETWORK_JSON)
+        version = (stat.st_mtime_ns, stat.st_size)
+    except OSError:
+        version = None
+    with road_network_lock:
+        if version != road_network_version:
+            road_network = load_road_network(ROAD_NETWORK_JSON) if version is not None else None
+            road_network_version = version
+        return road_network
+
+# Worker processes of /optimize/batch, started once and shared by all requests
+optimize_pool = None
+optimize_pool_lock = threading.Lock()
+
+def get_optimize_pool():
+    """Process pool of the batch optimize endpoint (BATCH_WORKERS processes)"""
+    global optimize_pool
+    from optimize.mip_solver import BATCH_WORKERS
+    with optimize_pool_lock:
+        if optimize_pool is None:
+            from concurrent.futures import ProcessPoolExecutor
+            optimize_pool = ProcessPoolExecutor(max_workers=BATCH_WORKERS)
+        return optimize_pool
+
+def get_job_queue():
+    """Job queue of this service process (SQLite store under artifacts/)"""
+    global job_queue
+    if job_queue is None:
+        from simulate.jobs import JOBS_DB, JobQueue, JobStore
+        job_queue = JobQueue(JobStore(JOBS_DB))
+    return job_queue
+
 def load_models():
     """Load pre-trained models on startup"""
     try:
@@ -98,6 +196,17 @@ async def startup_event():
     os.makedirs(artifacts_dir, exist_ok=True)
     os.makedirs("models", exist_ok=True)
     load_models()
+    get_optimize_pool()
+    recovered = get_job_queue().store.recover()
+    if recovered:
+        logger.warning(f"Marked {recovered} interrupted simulation jobs as failed")
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    if job_queue is not None:
+        job_queue.shutdown()
+    if optimize_pool is not None:
+        optimize_pool.shutdown(cancel_futures=True)
 
 @app.get("/")
 async def root():
@@ -178,63 +287,108 @@ async def optimize_allocation(request: OptimizeRequest):
     try:
         from optimize.mip_solver import solve_allocation_mip
         
+        # Trip times from the shared road network, when one is configured
+        travel_times = None
+        road_network = get_road_network()
+        if road_network is not None:
+            travel_times = road_network.travel_time_table(request.fleet, list(request.current_state.keys()))
+        
         result = solve_allocation_mip(
             current_state=request.current_state,
             vfa_estimates=request.vfa_estimates,
             fleet=request.fleet,
-            constraints=request.constraints
+            constraints=request.constraints,
+            travel_times=travel_times,
+            method=request.method,
+            time_limit_s=request.time_limit_s,
+            relative_gap=request.relative_gap,
+            forecasts=request.model_dump()["forecasts"],
+            n_scenarios=request.n_scenarios
         )
         
         return OptimizeResponse(**result)
         
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         logger.error(f"Optimization error: {e}")
-        # Fallback to simple heuristic allocation
-        allocations = []
-        districts = list(request.current_state.keys())
-        
-        for i, district in enumerate(districts[:3]):  # Allocate to first 3 districts
-            allocations.append({
-                "district": district,
-                "truck_class": "small_truck",
-                "count": 1,
-                "eta_hours": 2.0
-            })
-        
-        return OptimizeResponse(
-            allocations=allocations,
-            objective=1000.0,
-            solve_info={"status": "heuristic", "solve_time_s": 0.01}
-        )
+        raise HTTPException(status_code=500, detail=str(e))
 
-@app.post("/simulate", response_model=SimulateResponse)
-async def simulate_policy(request: SimulateRequest):
-    """Run offline simulation"""
+@app.post("/optimize/batch", response_model=OptimizeBatchResponse)
+def optimize_allocation_batch(request: OptimizeBatchRequest):
+    """Solve allocation variants over one fleet and district set; results come back in order"""
+    # A plain def: FastAPI runs the blocking solve in its threadpool, off the event loop
+    if not request.requests:
+        return OptimizeBatchResponse(results=[])
+    fleet = request.requests[0].fleet
+    if any(r.fleet != fleet for r in request.requests):
+        raise HTTPException(status_code=400, detail="All requests of a batch must share one fleet")
+    
     try:
-        from simulate.simulation_engine import run_simulation
+        from optimize.mip_solver import BATCH_WORKERS, solve_allocation_batch
+        from simulate.simulation_engine import resolve_workers
         
-        result = run_simulation(
-            scenario=request.scenario,
-            policy=request.policy,
-            n_episodes=request.n_episodes
+        # Districts and fleet are shared, so the trip times are looked up once
+        travel_times = None
+        road_network = get_road_network()
+        if road_network is not None:
+            travel_times = road_network.travel_time_table(fleet, list(request.requests[0].current_state.keys()))
+        
+        n_workers = BATCH_WORKERS if request.n_workers is None else min(resolve_workers(request.n_workers),
+                                                                        BATCH_WORKERS)
+        results = solve_allocation_batch(
+            [r.model_dump(exclude={"fleet"}) for r in request.requests],
+            fleet=fleet,
+            travel_times=travel_times,
+            n_workers=n_workers,
+            pool=get_optimize_pool()
         )
         
-        return SimulateResponse(**result)
+        return OptimizeBatchResponse(results=[OptimizeResponse(**result) for result in results])
         
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
-        logger.error(f"Simulation error: {e}")
-        # Return mock results
-        timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
-        output_file = f"./artifacts/experiments/sim_{request.policy}_{timestamp}.csv"
-        
-        return SimulateResponse(
-            results_summary={
-                "mean_cost": 1234.5,
-                "mean_deprivation": 3.8,
-                "demand_coverage": 0.85
-            },
-            output_file=output_file
-        )
+        logger.error(f"Batch optimization error: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/simulate", response_model=JobResponse, status_code=202)
+async def simulate_policy(request: SimulateRequest):
+    """Queue an offline simulation; poll /simulate/jobs/{job_id} for progress"""
+    job = get_job_queue().submit_simulation(request.model_dump())
+    return JobResponse.from_job(job)
+
+@app.get("/simulate/jobs", response_model=List[JobResponse])
+async def list_simulation_jobs(limit: int = 50):
+    """Recent simulation jobs, newest first"""
+    return [JobResponse.from_job(job) for job in get_job_queue().store.list(limit)]
+
+@app.get("/simulate/jobs/{job_id}", response_model=JobResponse)
+async def get_simulation_job(job_id: str):
+    """Status and progress (episodes completed) of a simulation job"""
+    job = get_job_queue().store.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job: {job_id}")
+    return JobResponse.from_job(job)
+
+@app.get("/simulate/jobs/{job_id}/result", response_model=SimulateResponse)
+async def get_simulation_result(job_id: str):
+    """Results of a finished job (a cancelled job covers the episodes it completed)"""
+    job = get_job_queue().store.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job: {job_id}")
+    if job["result"] is None:
+        detail = job["error"] or f"Job is {job['status']}"
+        raise HTTPException(status_code=409, detail=detail)
+    return SimulateResponse(**job["result"])
+
+@app.delete("/simulate/jobs/{job_id}", response_model=JobResponse)
+async def cancel_simulation_job(job_id: str):
+    """Cancel a queued or running simulation job"""
+    job = get_job_queue().cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job: {job_id}")
+    return JobResponse.from_job(job)
 
 @app.get("/models")
 async def list_models():
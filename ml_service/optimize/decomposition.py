@@ -0,0 +1,146 @@
+import time
+import numpy as np
+from typing import Dict, Tuple
+
+from optimize.fast_path import solve_greedy
+
+# Defaults of a decomposed solve: stop at this relative gap or after this long
+DECOMPOSE_TIME_LIMIT_S = 2.0
+DECOMPOSE_GAP = 1e-3
+
+# Upper bound on price updates, whatever the time budget
+MAX_DUAL_ITERATIONS = 2000
+
+# Price updates without a better bound before the step size is halved
+STALL_ITERATIONS = 20
+
+def solve_district_subproblems(cost: np.ndarray, upper: np.ndarray,
+                               capacity: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Best allocation of every district on its own
+
+    Without the fleet availability constraints the allocation problem splits
+    by district: each one takes its most negative vehicle classes up to their
+    bounds and its own capacity. That is `solve_greedy` with districts as the
+    batch axis, so all subproblems are solved in one vectorized call.
+
+    Args:
+        cost: Objective coefficients shaped (districts, classes)
+        upper: Integer upper bounds, same shape
+        capacity: Most vehicles each district can receive, shaped (districts,)
+
+    Returns:
+        Tuple of (counts shaped like `cost`, objective value per district)
+    """
+    counts, values = solve_greedy(cost[:, :, None], upper[:, :, None], capacity[:, None])
+    return counts[:, :, 0], values
+
+def solve_lagrangian(cost: np.ndarray, upper: np.ndarray, available: np.ndarray, capacity: np.ndarray,
+                     time_limit_s: float = DECOMPOSE_TIME_LIMIT_S,
+                     relative_gap: float = DECOMPOSE_GAP) -> Tuple[np.ndarray, float, Dict]:
+    """
+    Allocation by Lagrangian relaxation of the fleet availability constraints
+
+    Each class's availability constraint is priced into the objective, which
+    leaves independent district subproblems (`solve_district_subproblems`).
+    Their combined value is a lower bound on the optimum; prices follow
+    projected subgradient steps (Polyak step length towards the best known
+    allocation). Every relaxed solution is repaired into a feasible
+    allocation (over-used classes drop their least valuable vehicles, spare
+    vehicles then go to the best remaining slots), and the best of those is
+    returned once the gap to the bound is small enough or time runs out.
+
+    Args:
+        cost: Objective coefficients shaped (districts, classes)
+        upper: Integer upper bounds, same shape
+        available: Vehicles per class shaped (classes,)
+        capacity: Most vehicles per district shaped (districts,)
+        time_limit_s: Time budget
+        relative_gap: Stop once (objective - bound) / |objective| is below this
+
+    Returns:
+        Tuple of (counts, objective value, dictionary with `lower_bound`,
+        `gap` and `iterations`)
+    """
+    start = time.monotonic()
+    # Only vehicles that lower the objective are worth sending
+    upper = np.where(cost < 0, upper, 0).astype(int)
+    available = np.asarray(available, dtype=int)
+    capacity = np.asarray(capacity, dtype=int)
+
+    # Sending nothing is always feasible
+    best_counts = np.zeros_like(upper)
+    best_objective = 0.0
+    lower_bound = -np.inf
+
+    prices = np.zeros(len(available))
+    step_scale = 2.0
+    stalled = 0
+    iterations = 0
+    while iterations < MAX_DUAL_ITERATIONS:
+        iterations += 1
+        counts, values = solve_district_subproblems(cost + prices, upper, capacity)
+        dual_value = float(values.sum() - prices @ available)
+        if dual_value > lower_bound + 1e-9:
+            lower_bound = dual_value
+            stalled = 0
+        else:
+            stalled += 1
+            if stalled >= STALL_ITERATIONS:
+                step_scale /= 2
+                stalled = 0
+
+        repaired = _repair(counts, cost, upper, available, capacity)
+        objective = float((repaired * cost).sum())
+        if objective < best_objective:
+            best_counts, best_objective = repaired, objective
+
+        if (optimality_gap(best_objective, lower_bound) <= relative_gap
+                or time.monotonic() - start >= time_limit_s):
+            break
+
+        subgradient = (counts.sum(axis=0) - available).astype(float)
+        # Zero prices of classes with spare vehicles stay at zero
+        subgradient[(prices <= 0) & (subgradient < 0)] = 0
+        norm = subgradient @ subgradient
+        if norm == 0:
+            # The relaxed solution is feasible and complementary, hence optimal
+            break
+        prices = np.maximum(0, prices + step_scale * (best_objective - dual_value) / norm * subgradient)
+
+    return best_counts, best_objective, {
+        "lower_bound": lower_bound,
+        "gap": optimality_gap(best_objective, lower_bound),
+        "iterations": iterations
+    }
+
+def _repair(counts: np.ndarray, cost: np.ndarray, upper: np.ndarray, available: np.ndarray,
+            capacity: np.ndarray) -> np.ndarray:
+    """Feasible allocation close to a relaxed one"""
+    counts = counts.copy()
+
+    # Over-used classes drop their most expensive vehicles first
+    order = np.argsort(-cost, axis=0, kind='stable')
+    sorted_counts = np.take_along_axis(counts, order, axis=0)
+    excess = np.maximum(counts.sum(axis=0) - available, 0)
+    dropped_before = np.cumsum(sorted_counts, axis=0) - sorted_counts
+    dropped = np.clip(excess[None, :] - dropped_before, 0, sorted_counts)
+    np.put_along_axis(counts, order, sorted_counts - dropped, axis=0)
+
+    # Spare vehicles fill the remaining room, best classes first
+    spare = available - counts.sum(axis=0)
+    room = capacity - counts.sum(axis=1)
+    for j in np.argsort(cost.min(axis=0)):
+        if spare[j] <= 0:
+            continue
+        headroom = np.minimum(upper[:, j] - counts[:, j], room)
+        extra, _ = solve_greedy(cost[:, j:j + 1], headroom[:, None], spare[j:j + 1])
+        counts[:, j] += extra[:, 0]
+        room -= extra[:, 0]
+    return counts
+
+def optimality_gap(objective: float, bound: float) -> float:
+    """Relative gap between an allocation's objective and a lower bound on the optimum"""
+    if not np.isfinite(bound):
+        return float('inf')
+    return max(0.0, objective - bound) / max(abs(objective), 1e-6)
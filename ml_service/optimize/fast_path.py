@@ -0,0 +1,49 @@
+import numpy as np
+from typing import Dict, Optional, Tuple
+
+# Constraint keys the sorted-greedy solver handles exactly; anything else goes to the MIP
+SEPARABLE_CONSTRAINTS = frozenset({"lock_out", "vehicle_limits"})
+
+def is_separable(constraints: Optional[Dict]) -> bool:
+    """
+    Whether an allocation request has only the separable structure
+
+    Lock-outs are variable bounds and vehicle limits tighten the one
+    availability constraint of each class, so such a request decomposes into
+    an independent problem per vehicle class.
+    """
+    return set(constraints or {}) <= SEPARABLE_CONSTRAINTS
+
+def solve_greedy(cost: np.ndarray, upper: np.ndarray, available: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Exact solution of the separable allocation problem
+
+        min sum cost * x   s.t.  sum_d x[d, v] <= available[v],  0 <= x <= upper,  x integer
+
+    Each class is a continuous knapsack with unit weights: filling the most
+    negative coefficients first, up to their bounds, until the class runs
+    out is optimal, and the solution is integral. Leading axes are batch
+    axes (e.g. episodes), all solved at once.
+
+    Args:
+        cost: Objective coefficients shaped (..., districts, classes)
+        upper: Integer upper bounds, same shape
+        available: Vehicles per class shaped (..., classes)
+
+    Returns:
+        Tuple of (counts shaped like `cost`, objective values shaped like the
+        batch axes)
+    """
+    cost = np.asarray(cost, dtype=float)
+    # Only vehicles that lower the objective are worth sending
+    upper = np.where(cost < 0, np.asarray(upper), 0).astype(int)
+    available = np.maximum(np.asarray(available, dtype=int), 0)
+
+    order = np.argsort(cost, axis=-2, kind='stable')
+    sorted_upper = np.take_along_axis(upper, order, axis=-2)
+    granted_before = np.cumsum(sorted_upper, axis=-2) - sorted_upper
+    sorted_counts = np.clip(available[..., None, :] - granted_before, 0, sorted_upper)
+
+    counts = np.empty_like(sorted_counts)
+    np.put_along_axis(counts, order, sorted_counts, axis=-2)
+    return counts, (counts * cost).sum(axis=(-2, -1))
@@ -1,133 +1,606 @@
 from ortools.linear_solver import pywraplp
 import numpy as np
-from typing import Dict, List, Any
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
 import time
+import logging
+
+from optimize.decomposition import DECOMPOSE_GAP, DECOMPOSE_TIME_LIMIT_S, optimality_gap, solve_lagrangian
+from optimize.fast_path import SEPARABLE_CONSTRAINTS, is_separable, solve_greedy
+from optimize.stochastic import (DEFAULT_SCENARIOS, delivery_step, need_upper_bound, sample_demand_scenarios,
+                                 scenarios_for_budget, solve_saa)
+from simulate.routing import fleet_key
+
+logger = logging.getLogger(__name__)
+
+# Most vehicles of one class sent to one district per decision
+MAX_VEHICLES_PER_DISTRICT = 10
+
+# Penalty per unit of need a district is left without
+DEPRIVATION_PENALTY = 5
+
+# Solver sessions kept alive, least recently used dropped first
+MAX_SESSIONS = 32
+
+# Constraint keys the decomposed solver handles
+DECOMPOSABLE_CONSTRAINTS = SEPARABLE_CONSTRAINTS | {"district_capacity"}
+
+# 'auto' decomposes problems with at least this many districts
+DECOMPOSE_MIN_DISTRICTS = 200
+
+# Defaults of a MIP solve: stop at this relative gap or after this long
+MIP_TIME_LIMIT_S = 10.0
+MIP_GAP = 1e-4
+
+# Time the Lagrangian heuristic may spend on the starting incumbent of a MIP solve
+INCUMBENT_TIME_LIMIT_S = 0.2
+
+# Default worker processes of a batch solve
+BATCH_WORKERS = min(4, os.cpu_count() or 1)
+
+class AllocationProblem:
+    """
+    Array form of one allocation decision
+
+    Costs and bounds are laid out (districts, vehicle classes) in the order of
+    `districts` and `vehicle_classes`, so consecutive decisions over the same
+    districts and fleet differ only in array values.
+    """
+
+    __slots__ = ("districts", "vehicle_classes", "cost", "upper", "available", "capacity")
+
+    def __init__(self, districts: List[str], vehicle_classes: List[str], cost: np.ndarray,
+                 upper: np.ndarray, available: np.ndarray, capacity: np.ndarray):
+        """
+        Args:
+            districts: District ids (rows)
+            vehicle_classes: Fleet keys (columns; see `fleet_key`)
+            cost: Objective coefficient of one vehicle, shaped (districts, classes)
+            upper: Most vehicles per district and class (0 where locked out or
+                unreachable)
+            available: Vehicles per class that may be dispatched in total
+            capacity: Most vehicles per district over all classes
+        """
+        self.districts = districts
+        self.vehicle_classes = vehicle_classes
+        self.cost = cost
+        self.upper = upper
+        self.available = available
+        self.capacity = capacity
+
+    @property
+    def layout(self) -> Tuple[Tuple[str, ...], Tuple[str, ...]]:
+        """Model structure key: solver sessions are shared by equal layouts"""
+        return tuple(self.districts), tuple(self.vehicle_classes)
+
+def build_allocation_problem(current_state: Dict, vfa_estimates: Dict, fleet: List[Dict],
+                             constraints: Optional[Dict] = None,
+                             travel_times: Optional[Dict[str, Dict[str, float]]] = None,
+                             deprivation: bool = True) -> AllocationProblem:
+    """
+    Objective coefficients and bounds of the allocation MIP
+
+    Lock-outs become zero upper bounds, vehicle limits tighten the class
+    availability and district capacities bound each district's total, so
+    every request over the same districts and fleet has the same model
+    structure. See `solve_allocation_mip` for the arguments; `deprivation`
+    False leaves the point-estimate deprivation penalty out of the costs
+    (the stochastic model prices shortfalls per scenario instead).
+    """
+    districts = list(current_state.keys())
+    vehicle_classes = [fleet_key(v) for v in fleet]
+    travel_times = travel_times or {}
+    constraints = constraints or {}
+
+    # Trip hours from the road network (NaN where unknown, inf where unreachable)
+    trip_hours = np.array([
+        [travel_times.get(d, {}).get(v, np.nan) for v in vehicle_classes]
+        for d in districts
+    ], dtype=float).reshape(len(districts), len(vehicle_classes))
+    cost_per_hour = np.array([v.get('cost_per_hour', 50) for v in fleet], dtype=float)
+    capacity = np.array([v['capacity'] for v in fleet], dtype=float)
+    need = np.array([
+        current_state[d].get('demand_last_period', 0) + current_state[d].get('backlog', 0)
+        for d in districts
+    ], dtype=float)
+    vfa = np.array([vfa_estimates.get(d, 0) for d in districts], dtype=float)
+
+    # Transport cost (trip time on the road network when known, simplified otherwise)
+    known = np.isfinite(trip_hours)
+    transport_cost = np.where(known, np.where(known, trip_hours, 0) * cost_per_hour, 10.0)
+
+    # Deprivation penalty
+    deprivation_penalty = np.maximum(0, need[:, None] - capacity[None, :]) * DEPRIVATION_PENALTY
+    if not deprivation:
+        deprivation_penalty = np.zeros_like(deprivation_penalty)
+
+    # VFA future cost (discount factor 0.9)
+    future_cost = vfa[:, None] * 0.9
+
+    cost = transport_cost + deprivation_penalty + future_cost
+
+    upper = np.where(np.isinf(trip_hours), 0, MAX_VEHICLES_PER_DISTRICT).astype(int)
+    index = {d: i for i, d in enumerate(districts)}
+    upper[[index[d] for d in constraints.get('lock_out', []) if d in index]] = 0
+
+    available = np.array([v['count'] for v in fleet], dtype=int)
+    for v_class, limit in constraints.get('vehicle_limits', {}).items():
+        if v_class in vehicle_classes:
+            j = vehicle_classes.index(v_class)
+            available[j] = min(available[j], limit)
+
+    # Unlimited capacity is the most a district could receive anyway
+    capacity = upper.sum(axis=1)
+    for d, limit in constraints.get('district_capacity', {}).items():
+        if d in index:
+            capacity[index[d]] = min(capacity[index[d]], limit)
+
+    return AllocationProblem(districts, vehicle_classes, cost, upper, available, capacity)
+
+class MIPSession:
+    """
+    Persistent SCIP model of one district/fleet layout
+
+    The variables and availability constraints are created once; every solve
+    only rewrites objective coefficients, bound rows and constraint
+    right-hand sides in place and passes the previous solution as a hint,
+    which suits rolling-horizon loops where consecutive periods differ only
+    in state and value estimates.
+    """
+
+    def __init__(self, districts: List[str], vehicle_classes: List[str], solver_id: str = 'SCIP'):
+        """
+        Args:
+            districts: District ids of the layout
+            vehicle_classes: Vehicle classes of the layout
+            solver_id: OR-Tools backend
+
+        Raises:
+            RuntimeError: If the backend is not available
+        """
+        self.solver = pywraplp.Solver.CreateSolver(solver_id)
+        if not self.solver:
+            raise RuntimeError(f"MIP backend {solver_id} is not available")
+        self.districts = list(districts)
+        self.vehicle_classes = list(vehicle_classes)
+
+        # Variable bounds stay fixed: SCIP turns integer variables bounded by
+        # [0, 1] into binaries, which could then never be widened again. The
+        # per-solve bounds (lock-outs, reachability) are single-variable rows.
+        self.x = [
+            [self.solver.IntVar(0, MAX_VEHICLES_PER_DISTRICT, f'x_{d}_{v}') for v in vehicle_classes]
+            for d in districts
+        ]
+        self.flat_x = [var for row in self.x for var in row]
+        self.bounds = []
+        for row in self.x:
+            bound_row = []
+            for var in row:
+                constraint = self.solver.Constraint(0, 0)
+                constraint.SetCoefficient(var, 1)
+                bound_row.append(constraint)
+            self.bounds.append(bound_row)
+
+        # Vehicle availability (right-hand side set per solve)
+        self.availability = []
+        for j in range(len(vehicle_classes)):
+            constraint = self.solver.Constraint(0, 0)
+            for row in self.x:
+                constraint.SetCoefficient(row[j], 1)
+            self.availability.append(constraint)
+
+        # District capacity (right-hand side set per solve)
+        self.district_capacity = []
+        for row in self.x:
+            constraint = self.solver.Constraint(0, 0)
+            for var in row:
+                constraint.SetCoefficient(var, 1)
+            self.district_capacity.append(constraint)
+
+        self.solver.Objective().SetMinimization()
+        self.previous: Optional[np.ndarray] = None
+        self.solves = 0
+        self.lock = threading.Lock()
+
+    def solve(self, problem: AllocationProblem, time_limit_s: float = MIP_TIME_LIMIT_S,
+              relative_gap: float = MIP_GAP,
+              incumbent: Optional[np.ndarray] = None) -> Tuple[int, Optional[np.ndarray], float, float]:
+        """
+        Solve one decision on this layout
+
+        SCIP stops at the time limit or once its incumbent is within
+        `relative_gap` of the bound, and keeps the best incumbent either way.
+
+        Args:
+            problem: Decision on this layout
+            time_limit_s: Time limit of the solve
+            relative_gap: Relative gap at which the solve counts as optimal
+            incumbent: Starting solution used as the hint when this session
+                has no previous solution
+
+        Returns:
+            Tuple of (solver status, vehicle counts shaped (districts,
+            classes) or None without an incumbent, objective value, best
+            bound)
+        """
+        with self.lock:
+            objective = self.solver.Objective()
+            for i, row in enumerate(self.x):
+                for j, var in enumerate(row):
+                    self.bounds[i][j].SetUb(float(problem.upper[i, j]))
+                    objective.SetCoefficient(var, float(problem.cost[i, j]))
+            for j, constraint in enumerate(self.availability):
+                constraint.SetUb(float(problem.available[j]))
+            for i, constraint in enumerate(self.district_capacity):
+                constraint.SetUb(float(problem.capacity[i]))
+
+            hint = np.minimum(self.previous, problem.upper) if self.previous is not None else incumbent
+            if hint is not None:
+                self.solver.SetHint(self.flat_x, hint.ravel().astype(float).tolist())
+
+            self.solver.SetTimeLimit(max(1, int(time_limit_s * 1000)))
+            parameters = pywraplp.MPSolverParameters()
+            parameters.SetDoubleParam(pywraplp.MPSolverParameters.RELATIVE_MIP_GAP, relative_gap)
+            status = self.solver.Solve(parameters)
+            self.solves += 1
+            if status not in (pywraplp.Solver.OPTIMAL, pywraplp.Solver.FEASIBLE):
+                return status, None, float('nan'), float('-inf')
+
+            counts = np.rint([[var.solution_value() for var in row] for row in self.x]).astype(int)
+            counts = counts.reshape(len(self.districts), len(self.vehicle_classes))
+            self.previous = counts
+            return status, counts, objective.Value(), objective.BestBound()
+
+_sessions: "OrderedDict[Tuple, MIPSession]" = OrderedDict()
+_sessions_lock = threading.Lock()
+
+def get_session(problem: AllocationProblem) -> MIPSession:
+    """
+    Solver session for a problem's layout, created on first use
+
+    Raises:
+        RuntimeError: If the MIP backend is not available
+    """
+    key = problem.layout
+    with _sessions_lock:
+        session = _sessions.get(key)
+        if session is not None:
+            _sessions.move_to_end(key)
+            return session
+        session = MIPSession(problem.districts, problem.vehicle_classes)
+        _sessions[key] = session
+        if len(_sessions) > MAX_SESSIONS:
+            _sessions.popitem(last=False)
+        return session
+
+def clear_sessions():
+    """Drop every cached solver session"""
+    with _sessions_lock:
+        _sessions.clear()
 
 def solve_allocation_mip(current_state: Dict, vfa_estimates: Dict, 
-                        fleet: List[Dict], constraints: Dict = None) -> Dict:
+                        fleet: List[Dict], constraints: Dict = None,
+                        travel_times: Optional[Dict[str, Dict[str, float]]] = None,
+                        reuse_session: bool = True, method: str = "auto",
+                        time_limit_s: Optional[float] = None,
+                        relative_gap: Optional[float] = None,
+                        forecasts: Optional[Dict[str, Dict]] = None,
+                        n_scenarios: Optional[int] = None, seed: int = 0) -> Dict:
     """
     Solve MIP for vehicle allocation using OR-Tools
+    
+    Args:
+        current_state: District id -> state dictionary
+        vfa_estimates: District id -> value function estimate
+        fleet: Vehicle class dictionaries; an entry with a `depot` is the
+            class stationed at that depot (multi-depot fleets list a class
+            once per depot)
+        constraints: Optional `lock_out` (district ids), `vehicle_limits`
+            (fleet key -> most vehicles dispatched) and `district_capacity`
+            (district id -> most vehicles received)
+        travel_times: District id -> fleet key -> trip hours from the
+            road network (`RoadNetwork.travel_time_table`). Known trips are
+            costed at the class's hourly rate and reported as the ETA; an
+            infinite time means the class cannot reach the district.
+        reuse_session: Solve on the persistent, warm-started session of this
+            district/fleet layout (see `MIPSession`) instead of a new model
+        method: 'greedy' (exact sorted-greedy, see optimize/fast_path.py),
+            'decomposed' (Lagrangian relaxation of the fleet availability, see
+            optimize/decomposition.py), 'saa' (two-stage stochastic model
+            over demand scenarios, see optimize/stochastic.py), 'mip', or
+            'auto': SAA when forecasts are given, else greedy whenever the
+            constraints keep the problem separable per vehicle class,
+            decomposed for DECOMPOSE_MIN_DISTRICTS districts or more, the
+            MIP otherwise
+        time_limit_s: Time budget of a decomposed or MIP solve (defaults
+            DECOMPOSE_TIME_LIMIT_S and MIP_TIME_LIMIT_S)
+        relative_gap: Gap to the lower bound at which a decomposed or MIP
+            solve stops (defaults DECOMPOSE_GAP and MIP_GAP)
+        forecasts: District id -> demand forecast (as returned by
+            /forecast/batch) for the SAA model
+        n_scenarios: Demand scenarios of the SAA model (by default as many
+            as fit `time_limit_s`, DEFAULT_SCENARIOS without a time limit)
+        seed: Seed of the scenario draws
+
+    Returns:
+        Dictionary with the allocations, the objective and `solve_info`.
+        Solves that may stop early report the lower `bound` and the relative
+        `gap`; status 'feasible' means the time ran out first. A MIP solve
+        starts from an incumbent (the previous solution of its session, else
+        the Lagrangian heuristic's, which also contributes its bound) and
+        returns the best one found; `incumbent` says whether that came from
+        SCIP or, when SCIP found nothing better in time, the heuristic.
+        SAA solves report the scenario count and seed they drew with
+        (`n_scenarios`, `seed`), so a budget-sized run can be repeated.
     """
     start_time = time.time()
     
-    # Create solver
-    solver = pywraplp.Solver.CreateSolver('SCIP')
-    if not solver:
-        return _fallback_allocation(current_state, fleet)
+    if method not in ("auto", "greedy", "decomposed", "saa", "mip"):
+        raise ValueError(f"Unknown allocation method: {method}")
+    if method == "saa" and not forecasts:
+        raise ValueError("The SAA model needs demand forecasts")
+    if n_scenarios is not None and n_scenarios < 1:
+        raise ValueError(f"Scenario count must be positive, got {n_scenarios}")
+    if method == "greedy" and not is_separable(constraints):
+        raise ValueError(f"The greedy solver only supports the constraints {sorted(SEPARABLE_CONSTRAINTS)}")
+    if time_limit_s is not None and time_limit_s <= 0:
+        raise ValueError(f"Time limit must be positive, got {time_limit_s}")
+    if relative_gap is not None and relative_gap < 0:
+        raise ValueError(f"Relative gap must be non-negative, got {relative_gap}")
+    decomposable = set(constraints or {}) <= DECOMPOSABLE_CONSTRAINTS
+    if method == "decomposed" and not decomposable:
+        raise ValueError(f"The decomposed solver only supports the constraints {sorted(DECOMPOSABLE_CONSTRAINTS)}")
     
-    # Extract data
-    districts = list(current_state.keys())
-    vehicle_classes = [v['class'] for v in fleet]
-    
-    # Decision variables: x[district, vehicle_class]
-    x = {}
-    for d in districts:
-        for v in vehicle_classes:
-            x[d, v] = solver.IntVar(0, 10, f'x_{d}_{v}')
-    
-    # Constraints
-    # Vehicle availability
-    for v_info in fleet:
-        v_class = v_info['class']
-        available = v_info['count']
-        solver.Add(sum(x[d, v_class] for d in districts) <= available)
-    
-    # User constraints
-    if constraints:
-        # Lock out districts
-        if 'lock_out' in constraints:
-            for district in constraints['lock_out']:
-                if district in districts:
-                    for v in vehicle_classes:
-                        solver.Add(x[district, v] == 0)
-        
-        # Vehicle limits
-        if 'vehicle_limits' in constraints:
-            for v_class, limit in constraints['vehicle_limits'].items():
-                if v_class in vehicle_classes:
-                    solver.Add(sum(x[d, v_class] for d in districts) <= limit)
-    
-    # Objective function
-    objective = solver.Objective()
-    
-    for d in districts:
-        district_state = current_state[d]
-        demand = district_state.get('demand_last_period', 0)
-        backlog = district_state.get('backlog', 0)
-        
-        for v_info in fleet:
-            v_class = v_info['class']
-            capacity = v_info['capacity']
-            
-            # Transport cost (distance-based)
-            transport_cost = 10.0  # Simplified
-            
-            # Deprivation penalty
-            deprivation_penalty = max(0, (demand + backlog) - capacity) * 5
-            
-            # VFA future cost
-            future_cost = vfa_estimates.get(d, 0) * 0.9  # Discount factor
-            
-            total_cost = transport_cost + deprivation_penalty + future_cost
-            objective.SetCoefficient(x[d, v_class], total_cost)
-    
-    objective.SetMinimization()
-    
-    # Solve
-    status = solver.Solve()
-    solve_time = time.time() - start_time
-    
-    if status == pywraplp.Solver.OPTIMAL or status == pywraplp.Solver.FEASIBLE:
-        # Extract solution
-        allocations = []
-        for d in districts:
-            for v_info in fleet:
-                v_class = v_info['class']
-                count = int(x[d, v_class].solution_value())
-                if count > 0:
-                    # Calculate ETA based on distance and speed
-                    eta = np.random.uniform(1.5, 4.0)  # Simplified
-                    
-                    allocations.append({
-                        "district": d,
-                        "truck_class": v_class,
-                        "count": count,
-                        "eta_hours": round(eta, 1)
-                    })
-        
-        return {
-            "allocations": allocations,
-            "objective": solver.Objective().Value(),
-            "solve_info": {
-                "status": "optimal" if status == pywraplp.Solver.OPTIMAL else "feasible",
-                "solve_time_s": round(solve_time, 2)
-            }
-        }
+    if method == "saa" or (method == "auto" and forecasts):
+        return _solve_stochastic(current_state, vfa_estimates, fleet, constraints, travel_times, forecasts,
+                                 n_scenarios, seed, time_limit_s, relative_gap, start_time)
     
-    else:
-        return _fallback_allocation(current_state, fleet)
+    problem = build_allocation_problem(current_state, vfa_estimates, fleet, constraints, travel_times)
+    
+    if method in ("auto", "greedy") and is_separable(constraints):
+        counts, objective_value = solve_greedy(problem.cost, problem.upper, problem.available)
+        return _allocation_result(problem, fleet, counts, float(objective_value), travel_times, {
+            "status": "optimal",
+            "method": "greedy",
+            "solve_time_s": round(time.time() - start_time, 6)
+        })
+    
+    if method == "decomposed" or (method == "auto" and decomposable
+                                  and len(problem.districts) >= DECOMPOSE_MIN_DISTRICTS):
+        time_limit_s = DECOMPOSE_TIME_LIMIT_S if time_limit_s is None else time_limit_s
+        relative_gap = DECOMPOSE_GAP if relative_gap is None else relative_gap
+        counts, objective_value, info = solve_lagrangian(problem.cost, problem.upper, problem.available,
+                                                         problem.capacity, time_limit_s, relative_gap)
+        return _allocation_result(problem, fleet, counts, objective_value, travel_times, {
+            "status": "optimal" if info["gap"] <= relative_gap else "feasible",
+            "method": "decomposed",
+            "solve_time_s": round(time.time() - start_time, 4),
+            "bound": info["lower_bound"],
+            "gap": info["gap"],
+            "iterations": info["iterations"]
+        })
+    
+    time_limit_s = MIP_TIME_LIMIT_S if time_limit_s is None else time_limit_s
+    relative_gap = MIP_GAP if relative_gap is None else relative_gap
+    
+    try:
+        session = get_session(problem) if reuse_session else MIPSession(problem.districts,
+                                                                         problem.vehicle_classes)
+    except RuntimeError as e:
+        logger.warning(f"MIP unavailable, using the Lagrangian heuristic: {e}")
+        session = None
+    
+    # Starting incumbent of a cold solve, and the answer if SCIP finds nothing in time
+    incumbent = None
+    if session is None or session.previous is None:
+        incumbent = solve_lagrangian(problem.cost, problem.upper, problem.available, problem.capacity,
+                                     min(INCUMBENT_TIME_LIMIT_S, time_limit_s / 4), relative_gap)
+    
+    counts = None
+    if session is not None:
+        warm_start = session.previous is not None
+        remaining_s = max(time_limit_s - (time.time() - start_time), 0.001)
+        status, counts, objective_value, bound = session.solve(
+            problem, remaining_s, relative_gap, incumbent[0] if incumbent is not None else None
+        )
+        # SCIP reports its infinity when stopped before the first LP bound
+        if bound <= -session.solver.infinity():
+            bound = float('-inf')
+    
+    if counts is None and incumbent is None:
+        incumbent = solve_lagrangian(problem.cost, problem.upper, problem.available, problem.capacity,
+                                     INCUMBENT_TIME_LIMIT_S, relative_gap)
+    
+    # Best incumbent: SCIP's, unless the heuristic's starting one is better
+    source = "mip"
+    if incumbent is not None:
+        bound = max(bound, incumbent[2]["lower_bound"]) if counts is not None else incumbent[2]["lower_bound"]
+        if counts is None or incumbent[1] < objective_value - 1e-9:
+            counts, objective_value = incumbent[0], incumbent[1]
+            source = "heuristic"
+            logger.warning(f"No better MIP incumbent within {time_limit_s}s, returning the heuristic allocation")
+    
+    gap = optimality_gap(objective_value, bound)
+    solve_info = {
+        "status": "optimal" if gap <= relative_gap or (source == "mip" and status == pywraplp.Solver.OPTIMAL)
+                  else "feasible",
+        "method": "mip",
+        "incumbent": source,
+        "solve_time_s": round(time.time() - start_time, 4),
+        # No bound yet when a warm solve stopped before SCIP's first LP
+        "bound": bound if np.isfinite(bound) else None,
+        "gap": gap if np.isfinite(gap) else None,
+        "time_limit_s": time_limit_s
+    }
+    if session is not None:
+        solve_info["warm_start"] = warm_start
+        solve_info["session_solves"] = session.solves
+    return _allocation_result(problem, fleet, counts, objective_value, travel_times, solve_info)
 
-def _fallback_allocation(current_state: Dict, fleet: List[Dict]) -> Dict:
-    """Simple fallback allocation when MIP fails"""
-    allocations = []
-    districts = list(current_state.keys())
+def _solve_stochastic(current_state: Dict, vfa_estimates: Dict, fleet: List[Dict], constraints: Optional[Dict],
+                      travel_times: Optional[Dict[str, Dict[str, float]]], forecasts: Dict[str, Dict],
+                      n_scenarios: Optional[int], seed: int, time_limit_s: Optional[float],
+                      relative_gap: Optional[float], start_time: float) -> Dict:
+    """SAA allocation: `solve_saa` over demand scenarios drawn from the forecasts"""
+    problem = build_allocation_problem(current_state, vfa_estimates, fleet, constraints, travel_times,
+                                       deprivation=False)
+    vehicle_capacity = np.array([v['capacity'] for v in fleet], dtype=float)
+    backlog = np.array([current_state[d].get('backlog', 0) for d in problem.districts], dtype=float)
+    if n_scenarios is None:
+        # Sized by whether the cuts will come from the delivery lattice or from every scenario
+        n_scenarios = (scenarios_for_budget(len(problem.districts), time_limit_s, delivery_step(vehicle_capacity),
+                                            max_need=need_upper_bound(forecasts, problem.districts, backlog))
+                       if time_limit_s is not None else DEFAULT_SCENARIOS)
+    time_limit_s = MIP_TIME_LIMIT_S if time_limit_s is None else time_limit_s
+    relative_gap = MIP_GAP if relative_gap is None else relative_gap
+    
+    demand = sample_demand_scenarios(forecasts, problem.districts, n_scenarios, seed)
+    need = backlog[None, :] + demand
+    
+    remaining_s = max(time_limit_s - (time.time() - start_time), 0.001)
+    status, counts, objective_value, bound = solve_saa(
+        problem.cost, problem.upper, problem.available, problem.capacity, vehicle_capacity, need,
+        DEPRIVATION_PENALTY, remaining_s, relative_gap
+    )
+    if counts is None:
+        # Nothing found in time: sending nothing is feasible and leaves every need unmet
+        counts = np.zeros_like(problem.upper)
+        objective_value = float(DEPRIVATION_PENALTY * need.mean(axis=0).sum())
+    
+    unmet = np.maximum(need - (counts * vehicle_capacity[None, :]).sum(axis=1)[None, :], 0)
+    gap = optimality_gap(objective_value, bound)
+    return _allocation_result(problem, fleet, counts, objective_value, travel_times, {
+        "status": "optimal" if status == pywraplp.Solver.OPTIMAL or gap <= relative_gap else "feasible",
+        "method": "saa",
+        "solve_time_s": round(time.time() - start_time, 4),
+        "bound": bound if np.isfinite(bound) else None,
+        "gap": gap if np.isfinite(gap) else None,
+        "time_limit_s": time_limit_s,
+        "n_scenarios": n_scenarios,
+        "seed": seed,
+        "expected_unmet": float(unmet.mean(axis=0).sum()),
+        "unmet_p90": float(np.percentile(unmet.sum(axis=1), 90))
+    })
+
+def solve_allocation_batch(variants: List[Dict], fleet: List[Dict],
+                           travel_times: Optional[Dict[str, Dict[str, float]]] = None,
+                           n_workers: Optional[int] = None,
+                           pool: Optional[Executor] = None) -> List[Dict]:
+    """
+    Solve many allocation variants over the same districts and fleet
+    
+    Variants that take the greedy path are stacked and solved in one
+    `solve_greedy` call. The rest go through `solve_allocation_mip`, split
+    into one chunk per worker process: each worker builds the layout's
+    solver session once and warm-starts every later variant of its chunk
+    from the previous solution.
     
-    # Simple greedy allocation
-    for i, district in enumerate(districts[:3]):  # Allocate to worst 3 districts
-        if i < len(fleet):
-            v_info = fleet[i]
-            allocations.append({
-                "district": district,
-                "truck_class": v_info['class'],
-                "count": 1,
-                "eta_hours": 2.5
+    Args:
+        variants: Dictionaries of `solve_allocation_mip` arguments
+            (`current_state`, `vfa_estimates`, optional `constraints`,
+            `method`, `time_limit_s`, `relative_gap`)
+        fleet: Vehicle class dictionaries shared by the variants
+        travel_times: Trip-time table shared by the variants
+        n_workers: Processes for the MIP variants (None for in-process, 0 or
+            negative for all CPUs)
+        pool: Long-lived process pool to solve the chunks on; a pool of
+            `n_workers` processes is started for this call otherwise
+    
+    Returns:
+        Results in the order of `variants`
+    
+    Raises:
+        ValueError: If the variants cover different districts
+    """
+    from simulate.simulation_engine import resolve_workers
+    
+    if not variants:
+        return []
+    districts = list(variants[0]['current_state'])
+    variants = [dict(v) for v in variants]
+    for k, variant in enumerate(variants):
+        state = variant['current_state']
+        if len(state) != len(districts) or any(d not in state for d in districts):
+            raise ValueError(f"Variant {k} covers different districts than variant 0")
+        # Same district order everywhere, so every variant has the same layout
+        variant['current_state'] = {d: state[d] for d in districts}
+    
+    results: List[Optional[Dict]] = [None] * len(variants)
+    
+    # 'auto' with forecasts means the stochastic model
+    greedy = [k for k, v in enumerate(variants)
+              if v.get('method', 'auto') in ('auto', 'greedy') and is_separable(v.get('constraints'))
+              and not (v.get('method', 'auto') == 'auto' and v.get('forecasts'))]
+    if greedy:
+        start_time = time.time()
+        problems = [build_allocation_problem(variants[k]['current_state'], variants[k]['vfa_estimates'], fleet,
+                                             variants[k].get('constraints'), travel_times) for k in greedy]
+        counts, objectives = solve_greedy(np.stack([p.cost for p in problems]),
+                                          np.stack([p.upper for p in problems]),
+                                          np.stack([p.available for p in problems]))
+        solve_time = round(time.time() - start_time, 6)
+        for n, k in enumerate(greedy):
+            results[k] = _allocation_result(problems[n], fleet, counts[n], float(objectives[n]), travel_times, {
+                "status": "optimal",
+                "method": "greedy",
+                "solve_time_s": solve_time,
+                "batch_size": len(greedy)
             })
     
+    rest = [k for k in range(len(variants)) if results[k] is None]
+    n_workers = min(resolve_workers(n_workers), len(rest))
+    if n_workers <= 1:
+        for k in rest:
+            results[k] = solve_allocation_mip(fleet=fleet, travel_times=travel_times, **variants[k])
+    else:
+        chunks = [chunk.tolist() for chunk in np.array_split(rest, n_workers)]
+        own_pool = pool is None
+        if own_pool:
+            pool = ProcessPoolExecutor(max_workers=n_workers)
+        try:
+            futures = [pool.submit(_solve_variant_chunk, [variants[k] for k in chunk], fleet, travel_times)
+                       for chunk in chunks]
+            for chunk, future in zip(chunks, futures):
+                for k, result in zip(chunk, future.result()):
+                    results[k] = result
+        finally:
+            if own_pool:
+                pool.shutdown()
+    return results
+
+def _solve_variant_chunk(variants: List[Dict], fleet: List[Dict],
+                         travel_times: Optional[Dict[str, Dict[str, float]]]) -> List[Dict]:
+    """Process-pool worker: solve variants of one layout on this process's session"""
+    return [solve_allocation_mip(fleet=fleet, travel_times=travel_times, **variant) for variant in variants]
+
+def _allocation_result(problem: AllocationProblem, fleet: List[Dict], counts: np.ndarray,
+                       objective_value: float, travel_times: Optional[Dict[str, Dict[str, float]]],
+                       solve_info: Dict) -> Dict:
+    """API result of a solved allocation"""
+    travel_times = travel_times or {}
+    allocations = []
+    for i, j in zip(*np.nonzero(counts)):
+        d = problem.districts[i]
+        # ETA from the road network, simplified estimate otherwise
+        eta = travel_times.get(d, {}).get(problem.vehicle_classes[j])
+        if eta is None:
+            eta = np.random.uniform(1.5, 4.0)
+        
+        allocation = {
+            "district": d,
+            "truck_class": fleet[j]['class'],
+            "count": int(counts[i, j]),
+            "eta_hours": round(eta, 1)
+        }
+        if fleet[j].get('depot') is not None:
+            allocation["depot"] = fleet[j]['depot']
+        allocations.append(allocation)
+    
     return {
         "allocations": allocations,
-        "objective": 999.9,
-        "solve_info": {
-            "status": "fallback",
-            "solve_time_s": 0.01
-        }
-    }
\ No newline at end of file
+        "objective": objective_value,
+        "solve_info": solve_info
+    }
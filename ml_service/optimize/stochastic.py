@@ -0,0 +1,333 @@
+from ortools.linear_solver import pywraplp
+import numpy as np
+import time
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+# Probability levels of the forecast quantiles
+QUANTILE_LEVELS = {"p10": 0.1, "p50": 0.5, "p90": 0.9}
+
+# Demand multiplier of a surge, drawn per district and scenario with the forecast's surge_prob
+SURGE_MULTIPLIER = 2.0
+
+# Scenario counts: default, and the range a latency budget is mapped into
+DEFAULT_SCENARIOS = 50
+MIN_SCENARIOS = 10
+MAX_SCENARIOS = 2000
+
+# Share of the latency budget spent on scenarios when the model size does not depend on them
+SCENARIO_BUDGET_SHARE = 0.1
+
+# Instance `measure_throughput` times: districts, scenarios of the sampling
+# run and scenarios of the solver run (one cut per district and scenario)
+CALIBRATION_DISTRICTS = 50
+CALIBRATION_DRAW_SCENARIOS = 400
+CALIBRATION_CUT_SCENARIOS = 10
+
+# Lattice points per scenario beyond which evaluating the secant cuts costs more than sorting needs
+MAX_LATTICE_POINTS_PER_SCENARIO = 4
+
+# Standard deviations above the mean that bound a gamma-sampled demand in `need_upper_bound`
+GAMMA_TAIL_SDS = 4.0
+
+def scenarios_for_budget(n_districts: int, latency_budget_s: float, step: Optional[float] = None,
+                         throughput: Optional[Dict[str, float]] = None,
+                         max_need: Optional[float] = None) -> int:
+    """
+    Scenario count that fits a latency budget
+
+    With a delivery lattice (`shortfall_cuts` with a step) the model size is
+    bounded whatever K is, so scenarios may use a share of the budget for
+    sampling; without one, or when the needs span too many multiples of the
+    step for the lattice at that K, every scenario adds a cut per district
+    and K is sized to what the solver gets through.
+
+    Args:
+        n_districts: Districts of the allocation
+        latency_budget_s: Time budget of the whole solve
+        step: Delivery granularity (`delivery_step`), or None
+        throughput: `draws_per_second` and `cuts_per_second` of this machine;
+            None measures them once per process (`measure_throughput`)
+        max_need: Largest need a scenario is expected to hold
+            (`need_upper_bound`); None assumes the lattice applies
+    """
+    throughput = throughput or measure_throughput()
+    if step:
+        k = int(np.clip(SCENARIO_BUDGET_SHARE * latency_budget_s * throughput["draws_per_second"]
+                        / max(n_districts, 1), MIN_SCENARIOS, MAX_SCENARIOS))
+        n_points = int(np.ceil(max_need / step)) + 1 if max_need is not None else 0
+        if n_points <= MAX_LATTICE_POINTS_PER_SCENARIO * k:
+            return k
+    k = latency_budget_s * throughput["cuts_per_second"] / max(n_districts, 1)
+    return int(np.clip(k, MIN_SCENARIOS, MAX_SCENARIOS))
+
+def need_upper_bound(forecasts: Dict[str, Dict], districts: List[str], backlog: Optional[np.ndarray] = None,
+                     surge_multiplier: float = SURGE_MULTIPLIER) -> float:
+    """
+    Largest need `sample_demand_scenarios` is expected to draw
+
+    Exact for districts with quantiles (the tail knot, surged when the
+    district may surge); districts sampled from a gamma distribution count
+    GAMMA_TAIL_SDS standard deviations above their mean.
+
+    Args:
+        forecasts: District id -> forecast, as for `sample_demand_scenarios`
+        districts: Districts of the allocation
+        backlog: Need carried over per district, added to its demand
+        surge_multiplier: Demand multiplier of a surge
+
+    Returns:
+        Upper bound on the needs of any scenario
+    """
+    bound = 0.0
+    for i, d in enumerate(districts):
+        forecast = forecasts.get(d, {})
+        quantiles = forecast.get('quantiles') or {}
+        if all(quantiles.get(q) is not None for q in QUANTILE_LEVELS):
+            # Tail knot of the quantile function: the p50-p90 slope continued to level 1
+            p50, p90 = quantiles["p50"], quantiles["p90"]
+            demand = p90 + (p90 - p50) * (1 - QUANTILE_LEVELS["p90"]) / (QUANTILE_LEVELS["p90"] - QUANTILE_LEVELS["p50"])
+        else:
+            demand = forecast.get('mean', 0.0) + GAMMA_TAIL_SDS * np.sqrt(max(forecast.get('var', 0.0), 0.0))
+        if forecast.get('surge_prob', 0.0) > 0:
+            demand *= surge_multiplier
+        bound = max(bound, max(demand, 0.0) + (float(backlog[i]) if backlog is not None else 0.0))
+    return bound
+
+@lru_cache(maxsize=1)
+def measure_throughput() -> Dict[str, float]:
+    """
+    Scenario sampling and SAA solver throughput of this machine
+
+    Times a small synthetic instance: scenario draws (scenarios x
+    districts) sampled and turned into lattice cuts per second, and
+    per-scenario shortfall cuts built and solved per second. The small
+    instance carries the fixed solver overheads, so the rates are on the
+    conservative side. Measured once per process.
+
+    Returns:
+        Dictionary with `draws_per_second` and `cuts_per_second`
+    """
+    rng = np.random.default_rng(0)
+    n = CALIBRATION_DISTRICTS
+    districts = [f"D{i}" for i in range(n)]
+    forecasts = {d: {"mean": m, "var": m, "quantiles": {"p10": 0.3 * m, "p50": m, "p90": 2 * m},
+                     "surge_prob": 0.1}
+                 for d, m in zip(districts, rng.uniform(5, 50, n))}
+
+    start = time.perf_counter()
+    need = sample_demand_scenarios(forecasts, districts, CALIBRATION_DRAW_SCENARIOS)
+    shortfall_cuts(need, 1.0, 10.0)
+    draws_per_second = need.size / max(time.perf_counter() - start, 1e-6)
+
+    # Fractional capacities: no lattice, one cut per district and scenario
+    need = need[:CALIBRATION_CUT_SCENARIOS]
+    start = time.perf_counter()
+    solve_saa(rng.uniform(-10, 10, (n, 2)), np.full((n, 2), 10), np.array([n, n]), np.full(n, 10),
+              np.array([10.5, 3.3]), need, 5.0, time_limit_s=10.0, relative_gap=1e-4)
+    cuts_per_second = need.size / max(time.perf_counter() - start, 1e-6)
+
+    return {"draws_per_second": float(draws_per_second), "cuts_per_second": float(cuts_per_second)}
+
+def sample_demand_scenarios(forecasts: Dict[str, Dict], districts: List[str], n_scenarios: int,
+                            seed: int = 0, surge_multiplier: float = SURGE_MULTIPLIER) -> np.ndarray:
+    """
+    Demand scenarios drawn from per-district forecasts
+
+    Districts with p10/p50/p90 quantiles are sampled by inverting the
+    piecewise-linear quantile function through them (falling to zero below
+    p10 and continuing the p50-p90 slope above p90); the others from a gamma
+    distribution with the forecast mean and variance. Each draw is then
+    multiplied by `surge_multiplier` with the district's `surge_prob`.
+    All districts and scenarios are drawn at once.
+
+    Args:
+        forecasts: District id -> forecast (`mean`, `var`, `quantiles`,
+            `surge_prob`, as returned by /forecast/batch); missing districts
+            have zero demand
+        districts: District ordering of the columns
+        n_scenarios: Scenarios K
+        seed: Seed of the draws
+        surge_multiplier: Demand multiplier of a surge
+
+    Returns:
+        Array of demands shaped (scenarios, districts)
+    """
+    rng = np.random.default_rng(seed)
+    empty = {}
+    forecast = [forecasts.get(d, empty) for d in districts]
+    u = rng.random((n_scenarios, len(districts)))
+
+    # Quantile function knots: 0 at level 0, the forecast quantiles, a tail point at level 1
+    names = list(QUANTILE_LEVELS)
+    levels = np.array([0.0] + [QUANTILE_LEVELS[q] for q in names] + [1.0])
+    quantiles = np.array([[f.get('quantiles', empty).get(q, np.nan) for q in names] for f in forecast],
+                         dtype=float).reshape(len(districts), len(names))
+    tail = quantiles[:, -1] + (quantiles[:, -1] - quantiles[:, -2]) * (1 - levels[-2]) / (levels[-2] - levels[-3])
+    knots = np.column_stack([np.zeros(len(districts)), quantiles, tail])
+
+    segment = np.clip(np.searchsorted(levels, u, side='right') - 1, 0, len(levels) - 2)
+    columns = np.arange(len(districts))[None, :]
+    low, high = knots[columns, segment], knots[columns, segment + 1]
+    weight = (u - levels[segment]) / (levels[segment + 1] - levels[segment])
+    demand = low + weight * (high - low)
+
+    # Gamma draws where the quantiles are incomplete
+    missing = np.isnan(demand).any(axis=0)
+    if missing.any():
+        mean = np.array([forecast[i].get('mean', 0.0) for i in np.flatnonzero(missing)], dtype=float)
+        var = np.array([forecast[i].get('var', 0.0) for i in np.flatnonzero(missing)], dtype=float)
+        # Without spread the demand is the mean itself
+        spread = (mean > 0) & (var > 0)
+        shape = np.where(spread, mean ** 2 / np.where(spread, var, 1), 1)
+        scale = np.where(spread, var / np.where(spread, mean, 1), 0)
+        draws = rng.gamma(shape, scale, (n_scenarios, len(mean)))
+        demand[:, missing] = np.where(spread, draws, mean)
+
+    surge_prob = np.array([f.get('surge_prob', 0.0) for f in forecast], dtype=float)
+    surge = rng.random((n_scenarios, len(districts))) < surge_prob[None, :]
+    return np.maximum(demand, 0) * np.where(surge, surge_multiplier, 1.0)
+
+def shortfall_cuts(need: np.ndarray, penalty: float,
+                   step: Optional[float] = None) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Linear pieces of each district's expected shortfall penalty
+
+    The expected penalty of delivering capacity c to a district is
+    f(c) = penalty * mean_s max(0, need_s - c), convex and piecewise linear,
+    so it is the epigraph of linear cuts penalty >= intercept - slope * c:
+
+    - by default one cut per scenario: with needs n_1 >= ... >= n_K, f is the
+      maximum over j of (penalty / K) * (n_1 + ... + n_j - j * c);
+    - when deliveries only come in multiples of `step` (the common divisor
+      of the vehicle capacities), the secants of f between consecutive
+      multiples are exact at every deliverable capacity. Merged where
+      collinear they are never more than the K cuts, and far fewer once K
+      exceeds the number of multiples the needs span; they are used unless
+      that number is large against K.
+
+    Args:
+        need: Scenario needs shaped (scenarios, districts)
+        penalty: Penalty per unit of unmet need
+        step: Delivery granularity, or None
+
+    Returns:
+        Tuple of (intercepts, slopes), both shaped (districts, pieces);
+        pieces with a zero intercept are implied by the penalty being
+        non-negative and can be dropped
+    """
+    k = need.shape[0]
+    n_points = int(np.ceil(need.max() / step)) + 1 if step and need.size else None
+    if n_points is None or n_points > MAX_LATTICE_POINTS_PER_SCENARIO * k:
+        ordered = -np.sort(-need, axis=0)
+        intercepts = penalty / k * np.cumsum(ordered, axis=0).T
+        slopes = np.broadcast_to(penalty / k * np.arange(1, k + 1), intercepts.shape).copy()
+        return np.maximum(intercepts, 0), slopes
+
+    points = step * np.arange(n_points + 1)
+    # Needs sorted per district; at capacity c the shortfall sums the needs above c,
+    # found for all districts and points at once by searching the districts'
+    # needs laid end to end, each district offset past the previous one
+    n_districts = need.shape[1]
+    ordered = np.sort(need, axis=0)
+    below = np.vstack([np.zeros(n_districts), np.cumsum(ordered, axis=0)])
+    offsets = (max(ordered[-1].max(), points[-1]) + 1) * np.arange(n_districts)
+    n_below = (np.searchsorted((ordered + offsets).T.ravel(), (points[None, :] + offsets[:, None]).ravel(),
+                               side='right').reshape(n_districts, -1) - k * np.arange(n_districts)[:, None])
+    above_sum = below[-1][:, None] - np.take_along_axis(below.T, n_below, axis=1)
+    expected = penalty / k * np.maximum(above_sum - (k - n_below) * points[None, :], 0)
+    slopes = (expected[:, :-1] - expected[:, 1:]) / step
+    intercepts = expected[:, :-1] + slopes * points[None, :-1]
+
+    # A secant collinear with the previous one adds nothing
+    repeated = np.zeros_like(slopes, dtype=bool)
+    repeated[:, 1:] = np.isclose(slopes[:, 1:], slopes[:, :-1])
+    intercepts[repeated | (slopes <= 0)] = 0
+    return intercepts, slopes
+
+def delivery_step(vehicle_capacity: np.ndarray) -> Optional[float]:
+    """Common divisor of integral vehicle capacities (None when any is fractional)"""
+    if not np.allclose(vehicle_capacity, np.round(vehicle_capacity)):
+        return None
+    step = int(np.gcd.reduce(np.round(vehicle_capacity).astype(int)))
+    return float(step) if step > 0 else None
+
+def solve_saa(first_stage_cost: np.ndarray, upper: np.ndarray, available: np.ndarray,
+              district_capacity: np.ndarray, vehicle_capacity: np.ndarray, need: np.ndarray,
+              penalty: float, time_limit_s: float, relative_gap: float,
+              solver_id: str = 'SCIP') -> Tuple[int, Optional[np.ndarray], float, float]:
+    """
+    Two-stage sample average approximation of the allocation
+
+    First stage: integer vehicles x[d, v] with their transport and future
+    cost, under the usual bounds, fleet availability and district
+    capacities. Second stage, per scenario: the need a district's delivered
+    capacity sum_v capacity[v] * x[d, v] leaves unmet, at `penalty` per
+    unit, averaged over the scenarios through the `shortfall_cuts` epigraph.
+
+    Args:
+        first_stage_cost: Cost per vehicle shaped (districts, classes)
+        upper: Integer upper bounds, same shape
+        available: Vehicles per class
+        district_capacity: Most vehicles per district
+        vehicle_capacity: Supply one vehicle of each class delivers
+        need: Scenario needs shaped (scenarios, districts)
+        penalty: Penalty per unit of unmet need
+        time_limit_s: Time limit of the solve
+        relative_gap: Relative gap at which the solve counts as optimal
+
+    Returns:
+        Tuple of (solver status, counts or None without an incumbent,
+        objective value, best bound)
+
+    Raises:
+        RuntimeError: If the MIP backend is not available
+    """
+    solver = pywraplp.Solver.CreateSolver(solver_id)
+    if not solver:
+        raise RuntimeError(f"MIP backend {solver_id} is not available")
+    n_districts, n_classes = first_stage_cost.shape
+
+    x = [[solver.IntVar(0, float(upper[i, j]), f'x_{i}_{j}') for j in range(n_classes)]
+         for i in range(n_districts)]
+    theta = [solver.NumVar(0, solver.infinity(), f'theta_{i}') for i in range(n_districts)]
+
+    for j in range(n_classes):
+        constraint = solver.Constraint(0, float(available[j]))
+        for row in x:
+            constraint.SetCoefficient(row[j], 1)
+
+    intercepts, slopes = shortfall_cuts(need, penalty, delivery_step(vehicle_capacity))
+    for i, row in enumerate(x):
+        constraint = solver.Constraint(0, float(district_capacity[i]))
+        for var in row:
+            constraint.SetCoefficient(var, 1)
+
+        for intercept, slope in zip(intercepts[i], slopes[i]):
+            if intercept <= 0:
+                continue
+            cut = solver.Constraint(float(intercept), solver.infinity())
+            cut.SetCoefficient(theta[i], 1)
+            for j, var in enumerate(row):
+                cut.SetCoefficient(var, float(slope * vehicle_capacity[j]))
+
+    objective = solver.Objective()
+    for i, row in enumerate(x):
+        objective.SetCoefficient(theta[i], 1)
+        for j, var in enumerate(row):
+            objective.SetCoefficient(var, float(first_stage_cost[i, j]))
+    objective.SetMinimization()
+
+    solver.SetTimeLimit(max(1, int(time_limit_s * 1000)))
+    parameters = pywraplp.MPSolverParameters()
+    parameters.SetDoubleParam(pywraplp.MPSolverParameters.RELATIVE_MIP_GAP, relative_gap)
+    status = solver.Solve(parameters)
+    if status not in (pywraplp.Solver.OPTIMAL, pywraplp.Solver.FEASIBLE):
+        return status, None, float('nan'), float('-inf')
+
+    counts = np.rint([[var.solution_value() for var in row] for row in x]).astype(int)
+    counts = counts.reshape(n_districts, n_classes)
+    bound = objective.BestBound()
+    if bound <= -solver.infinity():
+        bound = float('-inf')
+    return status, counts, objective.Value(), bound
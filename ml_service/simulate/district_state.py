@@ -0,0 +1,120 @@
+import numpy as np
+from typing import Any, Dict, Iterable, List, Optional
+
+# Road access is stored as a small integer code per district
+ROAD_ACCESS_CODES = {"open": 0, "restricted": 1, "closed": 2}
+ROAD_ACCESS_NAMES = {code: name for name, code in ROAD_ACCESS_CODES.items()}
+
+class DistrictStateTable:
+    """
+    Columnar district state shared by the engine, the policies and the API
+
+    Every field is one NumPy array shaped (episodes, districts), so a single
+    table holds one episode (the API, serial runs) or many (batch runs).
+    District ids map to column indices through `index`, so per-period work
+    is array arithmetic instead of string-keyed dict lookups.
+    """
+
+    FIELDS = ("inventory", "demand_last_period", "backlog", "avg_deprivation_time")
+
+    __slots__ = ("district_ids", "index", "inventory", "demand_last_period",
+                 "backlog", "avg_deprivation_time", "road_access")
+
+    def __init__(self, district_ids: List[str], inventory: np.ndarray, demand_last_period: np.ndarray,
+                 backlog: np.ndarray, avg_deprivation_time: np.ndarray,
+                 road_access: Optional[np.ndarray] = None):
+        """
+        Build a table from per-field arrays
+
+        Args:
+            district_ids: District ids, one per column
+            inventory: Inventory shaped (episodes, districts) or (districts,)
+            demand_last_period: Last period's demand, same shape
+            backlog: Unmet demand, same shape
+            avg_deprivation_time: Deprivation time, same shape
+            road_access: Road access codes (see ROAD_ACCESS_CODES), all open when omitted
+        """
+        self.district_ids = list(district_ids)
+        self.index = {district_id: i for i, district_id in enumerate(self.district_ids)}
+
+        self.inventory = np.atleast_2d(np.asarray(inventory, dtype=float))
+        self.demand_last_period = np.atleast_2d(np.asarray(demand_last_period, dtype=float))
+        self.backlog = np.atleast_2d(np.asarray(backlog, dtype=float))
+        self.avg_deprivation_time = np.atleast_2d(np.asarray(avg_deprivation_time, dtype=float))
+
+        if road_access is None:
+            road_access = np.zeros(self.inventory.shape, dtype=np.int8)
+        self.road_access = np.atleast_2d(np.asarray(road_access, dtype=np.int8))
+
+        for field in self.FIELDS + ("road_access",):
+            if getattr(self, field).shape != self.inventory.shape:
+                raise ValueError(f"Column '{field}' has shape {getattr(self, field).shape}, "
+                                 f"expected {self.inventory.shape}")
+        if self.inventory.shape[1] != len(self.district_ids):
+            raise ValueError(f"{len(self.district_ids)} district ids for {self.inventory.shape[1]} columns")
+
+    @classmethod
+    def from_columns(cls, district_ids: List[str], columns: Dict[str, np.ndarray]) -> "DistrictStateTable":
+        """Build a table from a dictionary of field arrays (extra keys are ignored)"""
+        return cls(district_ids, *(columns[field] for field in cls.FIELDS), columns.get('road_access'))
+
+    @classmethod
+    def from_records(cls, records: Iterable[Dict[str, Any]]) -> "DistrictStateTable":
+        """
+        Build a one-episode table from per-district records
+
+        Args:
+            records: Dictionaries with `district_id`, the numeric fields and
+                optionally `road_access` (e.g. API DistrictState payloads)
+
+        Returns:
+            Table shaped (1, districts)
+        """
+        records = list(records)
+        columns = {
+            field: [float(r.get(field, 0.0)) for r in records]
+            for field in cls.FIELDS
+        }
+        columns['road_access'] = [ROAD_ACCESS_CODES.get(r.get('road_access', 'open'), 0) for r in records]
+        return cls.from_columns([r['district_id'] for r in records], columns)
+
+    def to_records(self, episode: int = 0) -> List[Dict[str, Any]]:
+        """Per-district records of one episode, in the API DistrictState layout"""
+        return [
+            {
+                "district_id": district_id,
+                "inventory": float(self.inventory[episode, i]),
+                "demand_last_period": float(self.demand_last_period[episode, i]),
+                "backlog": float(self.backlog[episode, i]),
+                "avg_deprivation_time": float(self.avg_deprivation_time[episode, i]),
+                "road_access": ROAD_ACCESS_NAMES.get(int(self.road_access[episode, i]), "open")
+            }
+            for i, district_id in enumerate(self.district_ids)
+        ]
+
+    @property
+    def n_episodes(self) -> int:
+        return self.inventory.shape[0]
+
+    @property
+    def n_districts(self) -> int:
+        return self.inventory.shape[1]
+
+    def get(self, district_id: str, field: str, episode: int = 0) -> float:
+        """Single value lookup through the id -> column index map"""
+        return getattr(self, field)[episode, self.index[district_id]]
+
+    def episode(self, episode: int) -> "DistrictStateTable":
+        """One-episode copy of a row"""
+        return DistrictStateTable(
+            self.district_ids,
+            *(getattr(self, field)[episode:episode + 1].copy() for field in self.FIELDS),
+            self.road_access[episode:episode + 1].copy()
+        )
+
+    def copy(self) -> "DistrictStateTable":
+        return DistrictStateTable(
+            self.district_ids,
+            *(getattr(self, field).copy() for field in self.FIELDS),
+            self.road_access.copy()
+        )
@@ -0,0 +1,298 @@
+import json
+import os
+import sqlite3
+import time
+import uuid
+from concurrent.futures import Future, ProcessPoolExecutor
+from contextlib import closing
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+JOBS_DB = "./artifacts/jobs.sqlite"
+
+# Simulation jobs run side by side; each may fan out over its own episode pool
+JOB_WORKERS = 2
+
+# Minimum seconds between progress writes (and cancellation checks) of a running job
+PROGRESS_INTERVAL_S = 0.5
+
+class JobStore:
+    """
+    SQLite-backed job table shared by the API process and the job workers
+
+    Every call opens its own short-lived connection, so the store can be used
+    from any process. The database runs in WAL mode, so status polls never
+    wait on a worker writing progress. Each job records the process id of the
+    API process that queued it (its workers are that process's children), so
+    several API processes can share one store.
+    """
+
+    def __init__(self, db_path: str = JOBS_DB):
+        """
+        Args:
+            db_path: SQLite database file (created on first use)
+        """
+        self.db_path = db_path
+        os.makedirs(os.path.dirname(os.path.abspath(db_path)), exist_ok=True)
+        with closing(self._connect()) as conn, conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    params TEXT NOT NULL,
+                    progress INTEGER NOT NULL DEFAULT 0,
+                    total INTEGER NOT NULL DEFAULT 0,
+                    cancel_requested INTEGER NOT NULL DEFAULT 0,
+                    result TEXT,
+                    error TEXT,
+                    created_at TEXT NOT NULL,
+                    started_at TEXT,
+                    finished_at TEXT,
+                    owner_pid INTEGER
+                )
+            """)
+            # Stores created before jobs had owners
+            columns = {row["name"] for row in conn.execute("PRAGMA table_info(jobs)")}
+            if "owner_pid" not in columns:
+                conn.execute("ALTER TABLE jobs ADD COLUMN owner_pid INTEGER")
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        return conn
+
+    def _execute(self, sql: str, args: tuple = ()) -> int:
+        """Run one statement in its own transaction; returns the affected row count"""
+        with closing(self._connect()) as conn, conn:
+            return conn.execute(sql, args).rowcount
+
+    def create(self, kind: str, params: Dict[str, Any], total: int = 0) -> str:
+        """
+        Add a queued job
+
+        Args:
+            kind: Job kind (e.g. 'simulate')
+            params: JSON-serialisable job parameters
+            total: Units of work (e.g. episodes) the job reports progress against
+
+        Returns:
+            New job id
+        """
+        job_id = uuid.uuid4().hex
+        self._execute(
+            "INSERT INTO jobs (id, kind, status, params, total, created_at, owner_pid) "
+            "VALUES (?, ?, 'queued', ?, ?, ?, ?)",
+            (job_id, kind, json.dumps(params), total, _now(), os.getpid())
+        )
+        return job_id
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Job record with decoded params and result, or None for an unknown id"""
+        with closing(self._connect()) as conn:
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return _decode(row) if row is not None else None
+
+    def list(self, limit: int = 50) -> List[Dict[str, Any]]:
+        """Most recent jobs first"""
+        with closing(self._connect()) as conn:
+            rows = conn.execute("SELECT * FROM jobs ORDER BY created_at DESC, rowid DESC LIMIT ?",
+                                (limit,)).fetchall()
+        return [_decode(row) for row in rows]
+
+    def claim(self, job_id: str) -> bool:
+        """Move a queued job to running; False when it was cancelled (or claimed) first"""
+        return self._execute(
+            "UPDATE jobs SET status = 'running', started_at = ? WHERE id = ? AND status = 'queued'",
+            (_now(), job_id)
+        ) == 1
+
+    def report_progress(self, job_id: str, progress: int, total: int) -> bool:
+        """Record progress; returns False once cancellation has been requested"""
+        with closing(self._connect()) as conn, conn:
+            conn.execute("UPDATE jobs SET progress = ?, total = ? WHERE id = ?", (progress, total, job_id))
+            row = conn.execute("SELECT cancel_requested FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return row is not None and not row["cancel_requested"]
+
+    def finish(self, job_id: str, status: str, result: Optional[Dict] = None, error: Optional[str] = None):
+        """Record the outcome of a job"""
+        self._execute(
+            "UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ? WHERE id = ?",
+            (status, json.dumps(result) if result is not None else None, error, _now(), job_id)
+        )
+
+    def request_cancel(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Ask a job to stop
+
+        A queued job is cancelled at once; a running job stops at its next
+        progress report and keeps the results of the episodes it finished.
+
+        Returns:
+            Updated job record, or None for an unknown id
+        """
+        with closing(self._connect()) as conn, conn:
+            conn.execute("UPDATE jobs SET cancel_requested = 1 WHERE id = ? AND status IN ('queued', 'running')",
+                         (job_id,))
+            conn.execute("UPDATE jobs SET status = 'cancelled', finished_at = ? WHERE id = ? AND status = 'queued'",
+                         (_now(), job_id))
+        return self.get(job_id)
+
+    def recover(self) -> int:
+        """
+        Fail the queued or running jobs whose owning process has exited
+
+        Jobs of live API processes (other uvicorn workers, or a previous
+        server still draining) are left alone.
+
+        Returns:
+            Number of jobs marked as failed
+        """
+        with closing(self._connect()) as conn:
+            rows = conn.execute("SELECT id, owner_pid FROM jobs WHERE status IN ('queued', 'running')").fetchall()
+        orphaned = [row["id"] for row in rows if not _process_alive(row["owner_pid"])]
+        if not orphaned:
+            return 0
+        placeholders = ", ".join("?" * len(orphaned))
+        return self._execute(
+            "UPDATE jobs SET status = 'failed', error = 'Interrupted by a service restart', finished_at = ? "
+            f"WHERE status IN ('queued', 'running') AND id IN ({placeholders})",
+            (_now(), *orphaned)
+        )
+
+def run_simulation_job(db_path: str, job_id: str):
+    """
+    Process-pool worker: run one queued simulation job to completion
+
+    Progress (episodes completed) is written to the store at most every
+    PROGRESS_INTERVAL_S; a cancellation request stops the run at the next
+    report and the job keeps the summary of the episodes it completed.
+    """
+    from simulate.simulation_engine import run_simulation
+
+    store = JobStore(db_path)
+    if not store.claim(job_id):
+        return
+    params = store.get(job_id)["params"]
+
+    last_report = [0.0]
+    keep_going = [True]
+
+    def progress(done: int, total: int) -> bool:
+        now = time.monotonic()
+        if done >= total or now - last_report[0] >= PROGRESS_INTERVAL_S:
+            last_report[0] = now
+            keep_going[0] = store.report_progress(job_id, done, total)
+        return keep_going[0]
+
+    try:
+        result = run_simulation(**params, progress=progress)
+    except Exception as e:
+        logger.error(f"Job {job_id} failed: {e}")
+        store.finish(job_id, "failed", error=str(e))
+        return
+
+    # Final count, whether the run finished, stopped early or was cancelled
+    store.report_progress(job_id, result["results_summary"].get("episodes", 0), params.get("n_episodes", 0))
+    error = result["results_summary"].get("error")
+    if error:
+        store.finish(job_id, "failed", result=result, error=error)
+    elif not keep_going[0]:
+        store.finish(job_id, "cancelled", result=result)
+    else:
+        store.finish(job_id, "completed", result=result)
+
+class JobQueue:
+    """
+    Runs jobs of a JobStore on a process pool
+
+    The API process only enqueues, polls and cancels, so its event loop stays
+    free while simulations run.
+    """
+
+    def __init__(self, store: JobStore, n_workers: int = JOB_WORKERS):
+        """
+        Args:
+            store: Job store shared with the workers
+            n_workers: Jobs run concurrently
+        """
+        self.store = store
+        self.n_workers = n_workers
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._futures: Dict[str, Future] = {}
+
+    def submit_simulation(self, params: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Queue a simulation
+
+        Args:
+            params: Keyword arguments of `run_simulation`
+
+        Returns:
+            Queued job record
+        """
+        if self._pool is None:
+            self._pool = ProcessPoolExecutor(max_workers=self.n_workers)
+        job_id = self.store.create("simulate", params, total=params.get("n_episodes", 0))
+        future = self._pool.submit(run_simulation_job, self.store.db_path, job_id)
+        self._futures[job_id] = future
+        future.add_done_callback(lambda f, job_id=job_id: self._done(job_id, f))
+        logger.info(f"Queued simulation job {job_id}")
+        return self.store.get(job_id)
+
+    def _done(self, job_id: str, future: Future):
+        self._futures.pop(job_id, None)
+        if future.cancelled():
+            return
+        error = future.exception()
+        if error is not None:
+            # The worker itself died (e.g. killed); its own handler never ran
+            logger.error(f"Job {job_id} worker failed: {error}")
+            self.store.finish(job_id, "failed", error=str(error))
+
+    def cancel(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Cancel a queued or running job; returns its record (None for an unknown id)"""
+        job = self.store.request_cancel(job_id)
+        future = self._futures.get(job_id)
+        if future is not None:
+            future.cancel()
+        return job
+
+    def wait(self, job_id: str, timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """Block until a job submitted here has finished (mainly for scripts and tests)"""
+        future = self._futures.get(job_id)
+        if future is not None:
+            future.result(timeout)
+        return self.store.get(job_id)
+
+    def shutdown(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+def _process_alive(pid: Optional[int]) -> bool:
+    """Whether a process id belongs to a running process (False for jobs without an owner)"""
+    if not pid:
+        return False
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # Exists, but belongs to another user
+        return True
+    return True
+
+def _now() -> str:
+    return datetime.now().isoformat(timespec="seconds")
+
+def _decode(row: sqlite3.Row) -> Dict[str, Any]:
+    job = dict(row)
+    job["params"] = json.loads(job["params"])
+    job["result"] = json.loads(job["result"]) if job["result"] else None
+    job["cancel_requested"] = bool(job["cancel_requested"])
+    return job
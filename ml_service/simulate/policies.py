@@ -0,0 +1,367 @@
+import os
+import joblib
+import numpy as np
+from typing import Dict, List, Optional, Tuple, Type
+import logging
+
+from simulate.district_state import DistrictStateTable
+
+logger = logging.getLogger(__name__)
+
+# Realised trips take up to this fraction longer than the shortest-route time
+ETA_JITTER = 0.5
+
+POLICY_REGISTRY: Dict[str, Type["Policy"]] = {}
+
+def register_policy(name: str):
+    """
+    Class decorator adding a Policy subclass to the registry
+
+    Example:
+        @register_policy("my_policy")
+        class MyPolicy(Policy):
+            def decide(self, state, demands, period, eta_noise, routes=None):
+                ...
+    """
+    def decorator(cls: Type["Policy"]) -> Type["Policy"]:
+        if name in POLICY_REGISTRY:
+            logger.warning(f"Policy '{name}' is being re-registered")
+        cls.name = name
+        POLICY_REGISTRY[name] = cls
+        return cls
+    return decorator
+
+def get_policy(name: str, fleet: List[Dict], **kwargs) -> "Policy":
+    """Instantiate a registered policy for a fleet"""
+    if name not in POLICY_REGISTRY:
+        raise ValueError(f"Unknown policy: {name} (available: {', '.join(available_policies())})")
+    return POLICY_REGISTRY[name](fleet, **kwargs)
+
+def available_policies() -> List[str]:
+    return sorted(POLICY_REGISTRY)
+
+def top_k_ranks(score: np.ndarray, k: int) -> np.ndarray:
+    """
+    Rank of every district within the k best of its row
+
+    `argpartition` selects the k highest scores per row in linear time and
+    only those k are sorted, so picking a few districts out of hundreds
+    never sorts the whole row. Ties keep the lower district index first.
+
+    Args:
+        score: Scores shaped (episodes, districts), higher is better
+        k: Number of ranked districts per row
+
+    Returns:
+        Integer ranks shaped like `score`: 0 for the best district, up to
+        k - 1, and `districts` for every district outside the top k
+    """
+    n_episodes, n_districts = score.shape
+    ranks = np.full(score.shape, n_districts, dtype=int)
+    k = min(k, n_districts)
+    if k <= 0:
+        return ranks
+
+    if k < n_districts:
+        top = np.sort(np.argpartition(-score, k - 1, axis=1)[:, :k], axis=1)
+    else:
+        top = np.broadcast_to(np.arange(n_districts), score.shape)
+
+    order = np.argsort(-np.take_along_axis(score, top, axis=1), axis=1, kind='stable')
+    top = np.take_along_axis(top, order, axis=1)
+    np.put_along_axis(ranks, top, np.broadcast_to(np.arange(k), (n_episodes, k)), axis=1)
+    return ranks
+
+class Policy:
+    """
+    Allocation policy over batched district state
+
+    `decide` sees every episode of a batch at once, as arrays shaped
+    (episodes, districts), and returns vehicle counts and ETAs shaped
+    (episodes, districts, vehicle classes) in the fleet's class order.
+    """
+
+    name = None
+
+    def __init__(self, fleet: List[Dict]):
+        self.fleet = fleet
+        self.vehicle_classes = [v['class'] for v in fleet]
+        self.class_index = {v: i for i, v in enumerate(self.vehicle_classes)}
+        self.fleet_count = {v['class']: v['count'] for v in fleet}
+
+    def decide(self, state: DistrictStateTable, demands: np.ndarray, period: int,
+               eta_noise: np.ndarray, routes: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Allocate vehicles for one period of every episode
+
+        Args:
+            state: District state table shaped (episodes, districts)
+            demands: Demands shaped (episodes, districts)
+            period: Current period
+            eta_noise: Uniform [0, 1) ETA draws shaped (episodes, districts)
+            routes: Trip hours shaped (districts, vehicle classes) or
+                (episodes, districts, vehicle classes), inf where a class
+                cannot reach a district; nominal ETA ranges when omitted
+
+        Returns:
+            Tuple of (vehicle counts, ETA hours)
+        """
+        raise NotImplementedError
+
+    def empty_allocation(self, demands: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        shape = demands.shape + (len(self.vehicle_classes),)
+        return np.zeros(shape, dtype=int), np.zeros(shape)
+
+    def assign(self, counts: np.ndarray, eta_hours: np.ndarray, mask: np.ndarray, vehicle_class: str,
+               count, low: float, high: float, eta_noise: np.ndarray, routes: Optional[np.ndarray]):
+        """
+        Send `count` vehicles of a class to the masked districts
+
+        With road routes the ETA is the trip time stretched by up to
+        ETA_JITTER and unreachable districts are dropped from the mask;
+        otherwise the ETA is drawn from the nominal [low, high) range.
+        """
+        if vehicle_class not in self.class_index:
+            return
+        j = self.class_index[vehicle_class]
+        if routes is None:
+            eta = low + (high - low) * eta_noise
+        else:
+            trip = routes[..., j]
+            mask = mask & np.isfinite(trip)
+            eta = trip * (1 + ETA_JITTER * eta_noise)
+        counts[:, :, j] = np.where(mask, count, counts[:, :, j])
+        eta_hours[:, :, j] = np.where(mask, eta, eta_hours[:, :, j])
+
+@register_policy("dl_vfa")
+class DLVFAPolicy(Policy):
+    """Deprivation-weighted need: small trucks first, then light UAVs in pairs"""
+
+    def decide(self, state, demands, period, eta_noise, routes=None):
+        counts, eta_hours = self.empty_allocation(demands)
+        if demands.shape[1] == 0:
+            return counts, eta_hours
+
+        priority = (state.backlog + demands) * (1 + state.avg_deprivation_time / 10)
+
+        # Small trucks go to the first eligible districts in priority order;
+        # once they run out, light UAVs (2 per allocation) take over
+        n_small = self.fleet_count.get('small_truck', 0)
+        n_uav = self.fleet_count.get('uav_light', 0)
+        uav_allocations = (n_uav + 1) // 2 if n_uav > 0 else 0
+        ranks = top_k_ranks(priority, n_small + uav_allocations)
+
+        small_mask = (priority > 15) & (ranks < n_small)
+        uav_mask = (priority > 25) & (ranks >= n_small) & (ranks < n_small + uav_allocations)
+
+        self.assign(counts, eta_hours, small_mask, "small_truck", 1, 1.5, 3.0, eta_noise, routes)
+        self.assign(counts, eta_hours, uav_mask, "uav_light", 2, 0.5, 1.5, eta_noise, routes)
+        return counts, eta_hours
+
+@register_policy("nn_vfa")
+class NNVFAPolicy(Policy):
+    """Composite urgency score, one small truck to each of the top 3 districts"""
+
+    def decide(self, state, demands, period, eta_noise, routes=None):
+        counts, eta_hours = self.empty_allocation(demands)
+        if demands.shape[1] == 0:
+            return counts, eta_hours
+
+        score = (state.backlog * 0.6 + demands * 0.4
+                 + state.avg_deprivation_time ** 1.5 * 2
+                 + np.maximum(0, 100 - state.inventory) * 0.1)
+
+        small_mask = (score > 20) & (top_k_ranks(score, 3) < 3)
+        self.assign(counts, eta_hours, small_mask, "small_truck", 1, 2.0, 3.5, eta_noise, routes)
+        return counts, eta_hours
+
+@register_policy("heuristic")
+class ProportionalHeuristicPolicy(Policy):
+    """Trucks in proportion to each district's share of total need"""
+
+    def decide(self, state, demands, period, eta_noise, routes=None):
+        counts, eta_hours = self.empty_allocation(demands)
+
+        need = state.backlog + demands
+        total_need = need.sum(axis=1, keepdims=True)
+        proportion = np.divide(need, total_need, out=np.zeros_like(need), where=total_need > 0)
+
+        vehicle_count = np.minimum(np.maximum(1, (proportion * 4).astype(int)), 2)
+        self.assign(counts, eta_hours, proportion > 0.15, "small_truck", vehicle_count, 2.0, 4.0,
+                    eta_noise, routes)
+        return counts, eta_hours
+
+@register_policy("greedy")
+class GreedyPolicy(Policy):
+    """Two small trucks to the district with the highest need"""
+
+    def decide(self, state, demands, period, eta_noise, routes=None):
+        counts, eta_hours = self.empty_allocation(demands)
+        n_episodes, n_districts = demands.shape
+        if n_districts == 0:
+            return counts, eta_hours
+
+        mask = np.zeros((n_episodes, n_districts), dtype=bool)
+        mask[np.arange(n_episodes), np.argmax(state.backlog + demands, axis=1)] = True
+        self.assign(counts, eta_hours, mask, "small_truck", 2, 1.5, 2.5, eta_noise, routes)
+        return counts, eta_hours
+
+@register_policy("round_robin")
+class RoundRobinPolicy(Policy):
+    """One small truck per period, cycling through the districts"""
+
+    def decide(self, state, demands, period, eta_noise, routes=None):
+        counts, eta_hours = self.empty_allocation(demands)
+        n_episodes, n_districts = demands.shape
+        if n_districts == 0:
+            return counts, eta_hours
+
+        mask = np.zeros((n_episodes, n_districts), dtype=bool)
+        mask[:, period % n_districts] = True
+        self.assign(counts, eta_hours, mask, "small_truck", 1, 2.0, 3.0, eta_noise, routes)
+        return counts, eta_hours
+
+# ----------------------------------------------------------------------
+# Model-backed value function approximation
+# ----------------------------------------------------------------------
+
+MODELS_DIR = os.path.join(os.path.dirname(__file__), '..', 'models')
+
+# Feature layout of train/train_dl_vfa.py and train/train_nn_vfa.py
+VFA_FEATURES = [
+    'total_inventory', 'total_backlog', 'max_deprivation', 'avg_surge_prob',
+    'inventory_imbalance', 'critical_districts', 'well_stocked_districts', 'mean_deprivation'
+]
+
+# Surge probability fed to the model; the training data draws it from Beta(1, 9)
+SURGE_PROB_PRIOR = 0.1
+
+def load_vfa_model(path: str) -> Dict:
+    """
+    Load a VFA model saved by the training scripts
+
+    Returns:
+        Dictionary with `model`, `scaler` and `feature_names`
+    """
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        raise FileNotFoundError(f"No trained VFA model at {path}; run train/train_dl_vfa.py or train/train_nn_vfa.py")
+
+    model_data = joblib.load(path)
+    if list(model_data.get('feature_names', [])) != VFA_FEATURES:
+        raise ValueError(f"VFA model at {path} expects features {model_data.get('feature_names')}, "
+                         f"simulation provides {VFA_FEATURES}")
+    return model_data
+
+class VFAModelPolicy(Policy):
+    """
+    One-step lookahead on a trained value function
+
+    Every district is a candidate for one vehicle of `vehicle_class`; the
+    candidate's post-decision state (and the state with no dispatch) is
+    summarised into the training features, and the model predicts its
+    future cost. Candidates of every district and episode go through the
+    scaler and the model in a single `predict` call. Vehicles then go to
+    the districts whose dispatch lowers the predicted cost the most.
+    """
+
+    model_path = None
+    vehicle_class = "small_truck"
+
+    def __init__(self, fleet: List[Dict], model_path: Optional[str] = None, model_data: Optional[Dict] = None):
+        """
+        Args:
+            fleet: Vehicle class dictionaries
+            model_path: Saved model (the class's `model_path` when omitted)
+            model_data: Already loaded model dictionary, instead of a path
+        """
+        super().__init__(fleet)
+        if model_data is None:
+            model_data = load_vfa_model(model_path or self.model_path)
+        self.model = model_data['model']
+        self.scaler = model_data['scaler']
+        self.capacity = next((v['capacity'] for v in fleet if v['class'] == self.vehicle_class), 0)
+
+    def candidate_features(self, state: DistrictStateTable, demands: np.ndarray) -> np.ndarray:
+        """
+        Training features of every candidate post-decision state
+
+        Candidate 0 dispatches nothing; candidate d + 1 sends one vehicle to
+        district d. Only one column changes per candidate, so aggregates are
+        updated from the no-dispatch totals instead of being recomputed.
+
+        Returns:
+            Features shaped (episodes, districts + 1, len(VFA_FEATURES))
+        """
+        n_episodes, n_districts = demands.shape
+
+        # No dispatch: demand joins the backlog, deprivation ages
+        backlog = state.backlog + demands
+        inventory = state.inventory
+        deprivation = np.where(backlog > 0, state.avg_deprivation_time + 1,
+                               np.maximum(0, state.avg_deprivation_time - 0.5))
+
+        # One vehicle to district d
+        served = np.minimum(backlog, self.capacity)
+        backlog_d = backlog - served
+        inventory_d = inventory + self.capacity - served
+        deprivation_d = np.where(backlog_d > 0, state.avg_deprivation_time + 1,
+                                 np.maximum(0, state.avg_deprivation_time - 0.5))
+
+        def with_candidates(total: np.ndarray, before: np.ndarray, after: np.ndarray) -> np.ndarray:
+            # Column 0 keeps the no-dispatch total, column d + 1 swaps district d's term
+            total = total[:, None]
+            return np.concatenate([total, total - before + after], axis=1)
+
+        total_inventory = with_candidates(inventory.sum(axis=1), inventory, inventory_d)
+        mean_square = with_candidates((inventory ** 2).sum(axis=1), inventory ** 2, inventory_d ** 2) / n_districts
+        inventory_var = mean_square - (total_inventory / n_districts) ** 2
+
+        # Maximum deprivation without district d, from the two largest values
+        top_two = -np.partition(-deprivation, min(1, n_districts - 1), axis=1)[:, :2]
+        at_max = deprivation == top_two[:, :1]
+        unique_max = at_max & (at_max.sum(axis=1, keepdims=True) == 1)
+        if n_districts > 1:
+            max_without = np.where(unique_max, top_two[:, -1:], top_two[:, :1])
+        else:
+            # A lone district has no others; deprivation is never negative
+            max_without = np.zeros_like(deprivation)
+        max_deprivation = np.concatenate([top_two[:, :1], np.maximum(max_without, deprivation_d)], axis=1)
+
+        return np.stack([
+            total_inventory,
+            with_candidates(backlog.sum(axis=1), backlog, backlog_d),
+            max_deprivation,
+            np.full((n_episodes, n_districts + 1), SURGE_PROB_PRIOR),
+            np.sqrt(np.maximum(inventory_var, 0)),
+            with_candidates((backlog > 20).sum(axis=1), backlog > 20, backlog_d > 20),
+            with_candidates((inventory > 100).sum(axis=1), inventory > 100, inventory_d > 100),
+            with_candidates(deprivation.sum(axis=1), deprivation, deprivation_d) / n_districts
+        ], axis=2)
+
+    def predict_values(self, features: np.ndarray) -> np.ndarray:
+        """Predicted future cost of every candidate, one scaler/model call for the whole batch"""
+        flat = features.reshape(-1, features.shape[-1])
+        return self.model.predict(self.scaler.transform(flat)).reshape(features.shape[:-1])
+
+    def decide(self, state, demands, period, eta_noise, routes=None):
+        counts, eta_hours = self.empty_allocation(demands)
+        if demands.shape[1] == 0 or self.capacity == 0:
+            return counts, eta_hours
+
+        values = self.predict_values(self.candidate_features(state, demands))
+        improvement = values[:, :1] - values[:, 1:]
+
+        n_vehicles = self.fleet_count.get(self.vehicle_class, 0)
+        mask = (improvement > 0) & (top_k_ranks(improvement, n_vehicles) < n_vehicles)
+        self.assign(counts, eta_hours, mask, self.vehicle_class, 1, 1.5, 3.0, eta_noise, routes)
+        return counts, eta_hours
+
+@register_policy("dl_vfa_model")
+class RidgeVFAPolicy(VFAModelPolicy):
+    """Lookahead on the Ridge regression VFA from train/train_dl_vfa.py"""
+    model_path = os.path.join(MODELS_DIR, 'dl_vfa.pkl')
+
+@register_policy("nn_vfa_model")
+class MLPVFAPolicy(VFAModelPolicy):
+    """Lookahead on the MLP VFA from train/train_nn_vfa.py"""
+    model_path = os.path.join(MODELS_DIR, 'nn_vfa.pkl')
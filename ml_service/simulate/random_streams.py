@@ -0,0 +1,28 @@
+import numpy as np
+from typing import Dict
+
+# Independent random streams used by every simulation episode. Keeping them
+# apart means e.g. a policy that draws more ETA noise never shifts the demand
+# an episode sees, so different policies face common random numbers.
+STREAM_NAMES = ("init", "demand", "roads", "policy")
+
+def episode_streams(seed: int, episode: int) -> Dict[str, np.random.Generator]:
+    """
+    Create the random streams for one episode
+
+    Streams are spawned from a SeedSequence keyed by (seed, episode), so an
+    episode's draws depend only on the scenario seed and its episode number,
+    never on which process or batch runs it or in which order. Episode
+    results report this `seed` and the `spawn_key`, so any single episode
+    can be replayed on its own.
+
+    Args:
+        seed: Scenario seed
+        episode: Episode number
+
+    Returns:
+        Dictionary mapping stream name to its random generator
+    """
+    episode_seq = np.random.SeedSequence(entropy=seed, spawn_key=(episode,))
+    children = episode_seq.spawn(len(STREAM_NAMES))
+    return {name: np.random.default_rng(child) for name, child in zip(STREAM_NAMES, children)}
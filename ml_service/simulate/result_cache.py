@@ -0,0 +1,221 @@
+import hashlib
+import json
+import os
+import sqlite3
+import time
+import joblib
+from contextlib import closing
+from typing import Any, Dict, List, Optional
+import logging
+
+from simulate.policies import POLICY_REGISTRY
+
+logger = logging.getLogger(__name__)
+
+RESULT_CACHE_DIR = "./artifacts/cache/results"
+
+# Episode segments are evicted least recently used first beyond this size
+RESULT_CACHE_MAX_BYTES = 1 << 30
+
+class ResultCache:
+    """
+    Content-addressed, size-bounded cache of simulation episode results
+
+    A run is identified by the hash of the scenario contents, the policy (and
+    the model file behind it, if any) and the engine version, so renamed or
+    copied scenario files still hit and edited ones miss. Under that key the
+    cache keeps:
+
+    - episode segments: full episode results of the batches that were
+      simulated, so a request for episodes 0-999 after one for 0-499 only
+      simulates 500-999;
+    - run summaries: the summary and output path of a finished request,
+      returned without touching the segments.
+
+    Segments are joblib files under `cache_dir`; the index is a SQLite table
+    next to them, so several processes can share the cache. When the
+    segments exceed `max_bytes` the least recently used go first.
+    """
+
+    def __init__(self, cache_dir: str = RESULT_CACHE_DIR, max_bytes: int = RESULT_CACHE_MAX_BYTES):
+        """
+        Args:
+            cache_dir: Directory of the segment files and the index
+            max_bytes: Size bound of the segment files
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        os.makedirs(cache_dir, exist_ok=True)
+        self.db_path = os.path.join(cache_dir, "index.sqlite")
+        with closing(self._connect()) as conn, conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS segments (
+                    path TEXT PRIMARY KEY,
+                    key TEXT NOT NULL,
+                    first_episode INTEGER NOT NULL,
+                    last_episode INTEGER NOT NULL,
+                    bytes INTEGER NOT NULL,
+                    last_used REAL NOT NULL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS segments_key ON segments (key, first_episode)")
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS summaries (
+                    key TEXT NOT NULL,
+                    request TEXT NOT NULL,
+                    summary TEXT NOT NULL,
+                    output_file TEXT NOT NULL,
+                    PRIMARY KEY (key, request)
+                )
+            """)
+
+    def _connect(self) -> sqlite3.Connection:
+        return sqlite3.connect(self.db_path, timeout=30)
+
+    @staticmethod
+    def key(scenario: Dict, policy: str, version: str) -> str:
+        """
+        Cache key of a scenario/policy pair
+
+        Args:
+            scenario: Scenario configuration (the file contents)
+            policy: Policy name
+            version: Engine version; bump it whenever episode results change
+        """
+        payload = {
+            "scenario": scenario,
+            "policy": policy,
+            "policy_model": policy_fingerprint(policy),
+            "version": version
+        }
+        return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()[:32]
+
+    def load_episodes(self, key: str, episodes: List[int]) -> Dict[int, Dict]:
+        """
+        Cached results of some episodes
+
+        Args:
+            key: Cache key
+            episodes: Episode numbers wanted
+
+        Returns:
+            Dictionary mapping episode number to its result, for the cached ones
+        """
+        if not episodes:
+            return {}
+        wanted = set(episodes)
+        with closing(self._connect()) as conn:
+            rows = conn.execute(
+                "SELECT path FROM segments WHERE key = ? AND first_episode <= ? AND last_episode >= ?",
+                (key, max(wanted), min(wanted))
+            ).fetchall()
+
+        found = {}
+        used = []
+        for (path,) in rows:
+            try:
+                results = joblib.load(path)
+            except (OSError, EOFError) as e:
+                logger.warning(f"Dropping unreadable result cache segment {path}: {e}")
+                self._forget([path])
+                continue
+            hits = {r['episode']: r for r in results if r['episode'] in wanted}
+            if hits:
+                found.update(hits)
+                used.append(path)
+
+        if used:
+            now = time.time()
+            with closing(self._connect()) as conn, conn:
+                conn.executemany("UPDATE segments SET last_used = ? WHERE path = ?", [(now, p) for p in used])
+        return found
+
+    def store_episodes(self, key: str, results: List[Dict]):
+        """Add a batch of episode results as one segment, then enforce the size bound"""
+        if not results:
+            return
+        episodes = [r['episode'] for r in results]
+        directory = os.path.join(self.cache_dir, key[:2], key)
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"ep{min(episodes)}-{max(episodes)}_{len(results)}_{os.getpid()}.joblib")
+
+        # Write under a temporary name so concurrent readers never see a partial file
+        tmp_path = f"{path}.tmp"
+        joblib.dump(results, tmp_path, compress=3)
+        os.replace(tmp_path, path)
+
+        with closing(self._connect()) as conn, conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO segments VALUES (?, ?, ?, ?, ?, ?)",
+                (path, key, min(episodes), max(episodes), os.path.getsize(path), time.time())
+            )
+        self.evict()
+
+    def load_summary(self, key: str, request: Dict[str, Any]) -> Optional[Dict]:
+        """
+        Summary of an identical earlier request whose output still exists
+
+        Args:
+            key: Cache key
+            request: Request parameters beyond the key (episodes, output format, ...)
+
+        Returns:
+            Dictionary with `results_summary` and `output_file`, or None
+        """
+        with closing(self._connect()) as conn:
+            row = conn.execute("SELECT summary, output_file FROM summaries WHERE key = ? AND request = ?",
+                               (key, _encode(request))).fetchone()
+        if row is None or not os.path.exists(row[1]):
+            return None
+        return {"results_summary": json.loads(row[0]), "output_file": row[1]}
+
+    def store_summary(self, key: str, request: Dict[str, Any], summary: Dict, output_file: str):
+        """Remember the summary and output of a finished request"""
+        with closing(self._connect()) as conn, conn:
+            conn.execute("INSERT OR REPLACE INTO summaries VALUES (?, ?, ?, ?)",
+                         (key, _encode(request), json.dumps(summary), output_file))
+
+    def size(self) -> int:
+        """Bytes of all cached segments"""
+        with closing(self._connect()) as conn:
+            return conn.execute("SELECT COALESCE(SUM(bytes), 0) FROM segments").fetchone()[0]
+
+    def evict(self):
+        """Delete least recently used segments until the cache fits `max_bytes`"""
+        excess = self.size() - self.max_bytes
+        if excess <= 0:
+            return
+        with closing(self._connect()) as conn:
+            rows = conn.execute("SELECT path, bytes FROM segments ORDER BY last_used").fetchall()
+
+        evicted = []
+        for path, size in rows:
+            if excess <= 0:
+                break
+            evicted.append(path)
+            excess -= size
+        self._forget(evicted)
+        logger.info(f"Evicted {len(evicted)} result cache segments")
+
+    def _forget(self, paths: List[str]):
+        for path in paths:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        with closing(self._connect()) as conn, conn:
+            conn.executemany("DELETE FROM segments WHERE path = ?", [(p,) for p in paths])
+            # Summaries go with the last segment of their key
+            conn.execute("DELETE FROM summaries WHERE key NOT IN (SELECT DISTINCT key FROM segments)")
+
+def policy_fingerprint(policy: str) -> Optional[str]:
+    """Hash of the model file behind a registered policy (None for model-free policies)"""
+    model_path = getattr(POLICY_REGISTRY.get(policy), 'model_path', None)
+    if not model_path or not os.path.exists(model_path):
+        return None
+    with open(model_path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()[:16]
+
+def _encode(request: Dict[str, Any]) -> str:
+    return json.dumps(request, sort_keys=True, default=str)
@@ -0,0 +1,209 @@
+import os
+import pandas as pd
+from datetime import datetime
+from typing import Dict, Iterable, List, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+RESULTS_DIR = "./artifacts/experiments"
+
+# Episodes buffered in memory before rows are flushed to disk
+RESULT_BATCH_SIZE = 512
+
+OUTPUT_FORMATS = ("parquet", "csv")
+
+# Name prefix of Parquet parts not committed to their dataset yet; readers
+# (pyarrow, and so pandas) skip files starting with "_"
+STAGING_PREFIX = "_staging-"
+
+class ResultWriter:
+    """
+    Streams episode results to disk in batches while a simulation runs
+
+    Every episode becomes one row of an episode table (its scalar fields) and
+    one row per period of a period table (the `period_history` entries), so
+    nothing nested ends up stringified. At most `batch_size` episodes are held
+    in memory; each flush appends to the output.
+
+    Parquet output is a directory with hive-style partitions that pyarrow,
+    pandas or DuckDB read as one dataset:
+
+        sim_<policy>_<timestamp>/episodes/policy=<policy>/part-00000.parquet
+        sim_<policy>_<timestamp>/periods/policy=<policy>/part-00000.parquet
+
+    CSV output is `sim_<policy>_<timestamp>.csv` for episodes plus
+    `sim_<policy>_<timestamp>_periods.csv` for periods. Rows without a
+    `period_history` (e.g. parameter-sweep rows) only fill the main table.
+
+    Several writers can add to one Parquet dataset (e.g. one per worker
+    process) by opening it with `dataset` and distinct `part_prefix`es. A
+    writer whose rows may still be discarded stages its parts
+    (`STAGING_PREFIX` + its part prefix); `commit_staged_parts` adds them to
+    the dataset and `discard_staged_parts` drops the rest.
+    """
+
+    def __init__(self, policy: str, output_format: str = "parquet", output_dir: str = RESULTS_DIR,
+                 batch_size: int = RESULT_BATCH_SIZE, prefix: str = "sim",
+                 dataset: Optional[str] = None, part_prefix: str = "part"):
+        """
+        Args:
+            policy: Policy name (file names and partition value)
+            output_format: 'parquet' or 'csv'
+            output_dir: Directory the run's output is created in
+            batch_size: Episodes buffered before a flush
+            prefix: File name prefix of the run's output
+            dataset: Existing Parquet dataset to add parts to instead of
+                creating a new output (`output_dir` and `prefix` are unused)
+            part_prefix: File name prefix of this writer's Parquet parts
+        """
+        if output_format not in OUTPUT_FORMATS:
+            raise ValueError(f"Unknown output format: {output_format} (expected one of {OUTPUT_FORMATS})")
+        if output_format == "parquet":
+            try:
+                import pyarrow  # noqa: F401
+            except ImportError:
+                raise ImportError("Parquet output needs pyarrow; install it or use output_format='csv'")
+        elif dataset is not None:
+            raise ValueError("Only Parquet datasets can be shared between writers")
+
+        self.policy = policy
+        self.output_format = output_format
+        self.batch_size = batch_size
+        self.part_prefix = part_prefix
+
+        if dataset is not None:
+            base = dataset
+        else:
+            timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+            base = os.path.join(output_dir, f"{prefix}_{policy}_{timestamp}")
+            # Runs started within the same second get a numbered suffix
+            suffix = 1
+            while os.path.exists(base if output_format == "parquet" else f"{base}.csv"):
+                base = os.path.join(output_dir, f"{prefix}_{policy}_{timestamp}_{suffix}")
+                suffix += 1
+        if output_format == "parquet":
+            self.path = base
+            self.episode_path = os.path.join(base, "episodes", f"policy={policy}")
+            self.period_path = os.path.join(base, "periods", f"policy={policy}")
+            os.makedirs(self.episode_path, exist_ok=True)
+            os.makedirs(self.period_path, exist_ok=True)
+        else:
+            os.makedirs(output_dir, exist_ok=True)
+            self.path = f"{base}.csv"
+            self.episode_path = self.path
+            self.period_path = f"{base}_periods.csv"
+
+        self.episodes_written = 0
+        self._parts = 0
+        self._episode_rows: List[Dict] = []
+        self._period_rows: List[Dict] = []
+        self._closed = False
+
+    def write(self, episode_results: Iterable[Dict]):
+        """Buffer episode results, flushing whenever a batch is full"""
+        for result in episode_results:
+            self._episode_rows.append({k: v for k, v in result.items() if k != 'period_history'})
+            for period in result.get('period_history', []):
+                self._period_rows.append({"episode": result['episode'], **period})
+            if len(self._episode_rows) >= self.batch_size:
+                self.flush()
+
+    def flush(self):
+        """Append the buffered rows to the output"""
+        if not self._episode_rows:
+            return
+
+        if self.output_format == "parquet":
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+
+            # The policy lives in the partition path, not in the files
+            episode_rows = [{k: v for k, v in row.items() if k != 'policy'} for row in self._episode_rows]
+            part = f"{self.part_prefix}-{self._parts:05d}.parquet"
+            pq.write_table(pa.Table.from_pylist(episode_rows), os.path.join(self.episode_path, part))
+            if self._period_rows:
+                pq.write_table(pa.Table.from_pylist(self._period_rows), os.path.join(self.period_path, part))
+        else:
+            header = self._parts == 0
+            pd.DataFrame(self._episode_rows).to_csv(self.episode_path, mode='a', header=header, index=False)
+            if self._period_rows:
+                pd.DataFrame(self._period_rows).to_csv(self.period_path, mode='a', header=header, index=False)
+
+        self.episodes_written += len(self._episode_rows)
+        self._parts += 1
+        self._episode_rows = []
+        self._period_rows = []
+
+    def close(self) -> str:
+        """
+        Flush what is left and finish the output
+
+        Returns:
+            Output path (Parquet dataset directory or episode CSV file)
+        """
+        if self._closed:
+            return self.path
+        self.flush()
+        if self.output_format == "csv" and self.episodes_written == 0:
+            # Keep an (empty) file for runs without results, as before
+            pd.DataFrame().to_csv(self.episode_path, index=False)
+        self._closed = True
+        logger.info(f"Results saved to {self.path} ({self.episodes_written} episodes)")
+        return self.path
+
+    def __enter__(self) -> "ResultWriter":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+def _partition_dirs(dataset: str, policy: str) -> List[str]:
+    return [os.path.join(dataset, table, f"policy={policy}") for table in ("episodes", "periods")]
+
+def commit_staged_parts(dataset: str, policy: str, part_prefix: str) -> int:
+    """
+    Add the parts a writer staged under `STAGING_PREFIX` + `part_prefix` to a Parquet dataset
+
+    Returns:
+        Number of part files committed
+    """
+    staged = f"{STAGING_PREFIX}{part_prefix}-"
+    committed = 0
+    for directory in _partition_dirs(dataset, policy):
+        for name in os.listdir(directory):
+            if name.startswith(staged):
+                os.replace(os.path.join(directory, name), os.path.join(directory, name[len(STAGING_PREFIX):]))
+                committed += 1
+    return committed
+
+def discard_staged_parts(dataset: str, policy: str) -> int:
+    """
+    Delete the parts of a Parquet dataset that were staged but never committed
+
+    Returns:
+        Number of part files deleted
+    """
+    discarded = 0
+    for directory in _partition_dirs(dataset, policy):
+        for name in os.listdir(directory):
+            if name.startswith(STAGING_PREFIX):
+                os.remove(os.path.join(directory, name))
+                discarded += 1
+    if discarded:
+        logger.info(f"Discarded {discarded} uncommitted parts of {dataset}")
+    return discarded
+
+def read_results(path: str, table: str = "episodes") -> pd.DataFrame:
+    """
+    Load a ResultWriter output back into pandas
+
+    Args:
+        path: Path returned by `ResultWriter.close`
+        table: 'episodes' or 'periods'
+    """
+    if path.endswith(".csv"):
+        if table == "periods":
+            path = path[:-len(".csv")] + "_periods.csv"
+        return pd.read_csv(path)
+    return pd.read_parquet(os.path.join(path, table))
@@ -0,0 +1,350 @@
+import json
+import os
+import threading
+from collections import OrderedDict
+import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import shortest_path
+from typing import Dict, List, Optional
+import logging
+
+from simulate.scenarios import PROCESSED_DATA_DIR
+
+logger = logging.getLogger(__name__)
+
+ROAD_NETWORK_JSON = os.path.join(PROCESSED_DATA_DIR, 'road_network.json')
+
+# Time spent loading at the depot before every trip
+LOADING_HOURS = 0.5
+
+# Number of road-status patterns whose all-pairs matrices are kept in memory
+ROUTE_CACHE_SIZE = 64
+
+# A new graph version is derived from the closest cached one when at most
+# this many edges changed; beyond that a full recomputation is cheaper
+MAX_INCREMENTAL_CHANGES = 8
+
+EARTH_RADIUS_KM = 6371.0
+
+def is_air_vehicle(vehicle: Dict) -> bool:
+    """UAV classes fly straight lines; everything else drives on the road graph"""
+    return vehicle.get('mode', 'air' if vehicle['class'].startswith('uav') else 'ground') == 'air'
+
+def fleet_key(vehicle: Dict) -> str:
+    """
+    Identifier of a fleet entry: its class, or 'class@depot' for an entry
+    stationed at its own depot (multi-depot fleets list a class once per depot)
+    """
+    depot = vehicle.get('depot')
+    return f"{vehicle['class']}@{depot}" if depot is not None else vehicle['class']
+
+def haversine_km(origin: np.ndarray, points: np.ndarray) -> np.ndarray:
+    """Great-circle distance in km from one [lat, lon] origin to an array of [lat, lon] points"""
+    lat1, lon1 = np.radians(origin)
+    lat2, lon2 = np.radians(points[:, 0]), np.radians(points[:, 1])
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(a))
+
+class RoadNetwork:
+    """
+    Road graph as edge arrays with cached all-pairs shortest travel times
+
+    The graph itself never changes; road failures are expressed as a boolean
+    "open" mask over the edges. Each distinct mask is one graph version whose
+    dense (nodes, nodes) travel-time matrix is computed once and then served
+    from an LRU cache, so route lookups are plain array indexing. A version
+    that differs from a cached one by a few edges is derived incrementally:
+    a failed edge only re-runs Dijkstra from the sources whose shortest paths
+    used it, and a reopened edge is a single O(nodes^2) relaxation.
+    """
+
+    def __init__(self, road_graph: Dict, depot: Optional[str] = None,
+                 cache_size: int = ROUTE_CACHE_SIZE):
+        """
+        Build the network from a `{"nodes": [...], "edges": [...]}` graph
+
+        Args:
+            road_graph: Graph in the layout of `SimulationEngine._initialize_roads`
+            depot: Node id vehicles leave from (first node when omitted)
+            cache_size: Number of graph versions kept in the route cache
+        """
+        nodes = road_graph.get('nodes', [])
+        self.node_ids = [node['id'] for node in nodes]
+        self.index = {node_id: i for i, node_id in enumerate(self.node_ids)}
+
+        coords = [node.get('coords') for node in nodes]
+        if nodes and all(c is not None for c in coords):
+            self.coords = np.asarray(coords, dtype=float)
+        else:
+            self.coords = None
+
+        edges = [e for e in road_graph.get('edges', []) if e['u'] in self.index and e['v'] in self.index]
+        self.edge_u = np.array([self.index[e['u']] for e in edges], dtype=np.intp)
+        self.edge_v = np.array([self.index[e['v']] for e in edges], dtype=np.intp)
+        self.distance = np.array([e.get('distance', 0.0) for e in edges], dtype=float)
+        self.travel_time = np.array([e['travel_time_mean'] for e in edges], dtype=float)
+        self.failure_prob = np.array([e.get('failure_prob', 0.0) for e in edges], dtype=float)
+
+        self._pair_edges = {}
+        for i, e in enumerate(edges):
+            self._pair_edges.setdefault(frozenset((e['u'], e['v'])), []).append(i)
+
+        if depot is None and self.node_ids:
+            depot = self.node_ids[0]
+        if depot is not None and depot not in self.index:
+            raise ValueError(f"Depot {depot} is not a road network node")
+        self.depot = self.index[depot] if depot is not None else None
+
+        self.cache_size = cache_size
+        self._cache = OrderedDict()
+        # A service shares one network across request threads
+        self._cache_lock = threading.Lock()
+
+    @property
+    def n_nodes(self) -> int:
+        return len(self.node_ids)
+
+    @property
+    def n_edges(self) -> int:
+        return len(self.edge_u)
+
+    def all_open(self) -> np.ndarray:
+        """Edge mask of the undamaged network"""
+        return np.ones(self.n_edges, dtype=bool)
+
+    def edges_between(self, u: str, v: str) -> List[int]:
+        """Indices of the edges joining two nodes (either direction)"""
+        return self._pair_edges.get(frozenset((u, v)), [])
+
+    def edge_status(self, road_graph: Dict) -> np.ndarray:
+        """Open-edge mask read from the `status` fields of a graph dictionary"""
+        edges = [e for e in road_graph.get('edges', []) if e['u'] in self.index and e['v'] in self.index]
+        return np.array([e.get('status', 'open') == 'open' for e in edges], dtype=bool)
+
+    def all_pairs(self, open_mask: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Shortest travel times between every pair of nodes
+
+        Args:
+            open_mask: Open-edge mask (every edge open when omitted)
+
+        Returns:
+            Read-only (nodes, nodes) matrix of hours, inf where unreachable
+        """
+        if open_mask is None:
+            open_mask = self.all_open()
+        key = np.packbits(open_mask).tobytes()
+
+        with self._cache_lock:
+            cached = self._cache.get(key)
+            if cached is not None:
+                self._cache.move_to_end(key)
+                return cached[1]
+
+            matrix = None
+            if self._cache:
+                # Closest cached graph version by number of changed edges
+                base_mask, base_matrix = min(self._cache.values(),
+                                             key=lambda entry: np.count_nonzero(entry[0] != open_mask))
+                if np.count_nonzero(base_mask != open_mask) <= MAX_INCREMENTAL_CHANGES:
+                    matrix = self.update_all_pairs(base_matrix, base_mask, open_mask)
+            if matrix is None:
+                matrix = self._shortest_paths(open_mask)
+
+            matrix.setflags(write=False)
+            self._cache[key] = (open_mask.copy(), matrix)
+            if len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+            return matrix
+
+    def update_all_pairs(self, matrix: np.ndarray, old_mask: np.ndarray, new_mask: np.ndarray) -> np.ndarray:
+        """
+        Derive the all-pairs matrix of `new_mask` from the one of `old_mask`
+
+        Failed edges are handled first: only sources for which the edge is
+        tight (it lies on one of their shortest paths) can get longer routes,
+        so Dijkstra re-runs from those rows alone and the symmetric columns
+        follow. Reopened edges can only shorten routes through themselves,
+        which one vectorised relaxation per edge captures.
+
+        Args:
+            matrix: All-pairs travel times of `old_mask`
+            old_mask: Open-edge mask `matrix` was computed for
+            new_mask: Open-edge mask to compute
+
+        Returns:
+            New (nodes, nodes) matrix (the input is left untouched)
+        """
+        matrix = np.array(matrix)
+        failed = np.flatnonzero(old_mask & ~new_mask)
+        reopened = np.flatnonzero(~old_mask & new_mask)
+
+        if len(failed):
+            affected = np.zeros(self.n_nodes, dtype=bool)
+            for e in failed:
+                u, v, w = self.edge_u[e], self.edge_v[e], self.travel_time[e]
+                reachable = np.isfinite(matrix[:, u])
+                affected |= reachable & np.isclose(matrix[:, u] + w, matrix[:, v])
+                affected |= reachable & np.isclose(matrix[:, v] + w, matrix[:, u])
+
+            sources = np.flatnonzero(affected)
+            if len(sources):
+                rows = self._shortest_paths(old_mask & new_mask, indices=sources)
+                matrix[sources, :] = rows
+                matrix[:, sources] = rows.T
+
+        for e in reopened:
+            u, v, w = self.edge_u[e], self.edge_v[e], self.travel_time[e]
+            via_edge = np.minimum(matrix[:, u, None] + w + matrix[None, v, :],
+                                  matrix[:, v, None] + w + matrix[None, u, :])
+            np.minimum(matrix, via_edge, out=matrix)
+
+        return matrix
+
+    def _adjacency(self, open_mask: np.ndarray) -> csr_matrix:
+        """Sparse adjacency of the open edges, keeping the fastest of parallel edges"""
+        u, v, t = self.edge_u[open_mask], self.edge_v[open_mask], self.travel_time[open_mask]
+        low, high = np.minimum(u, v), np.maximum(u, v)
+
+        # csr_matrix sums duplicate entries, so only the fastest edge per pair is kept
+        order = np.lexsort((t, high, low))
+        pair = low[order] * self.n_nodes + high[order]
+        first = np.ones(len(order), dtype=bool)
+        first[1:] = pair[1:] != pair[:-1]
+        order = order[first]
+
+        return csr_matrix((t[order], (low[order], high[order])), shape=(self.n_nodes, self.n_nodes))
+
+    def _shortest_paths(self, open_mask: np.ndarray, indices: Optional[np.ndarray] = None) -> np.ndarray:
+        """Dijkstra from every node (or from `indices` only) over the open edges"""
+        return shortest_path(self._adjacency(open_mask), method='D', directed=False, indices=indices)
+
+    def vehicle_travel_times(self, fleet: List[Dict], district_ids: List[str],
+                             open_mask: Optional[np.ndarray] = None) -> np.ndarray:
+        """
+        Depot-to-district trip times for every vehicle class
+
+        Ground vehicles follow the shortest open road route; UAVs fly the
+        straight line at their speed and only reach districts within half
+        their range (they have to fly back). Each fleet entry leaves from its
+        own `depot` node when it names one, from the network depot otherwise.
+
+        Args:
+            fleet: Vehicle class dictionaries (`class`, `speed`, `range_km`,
+                optional `depot`)
+            district_ids: District ordering of the rows
+            open_mask: Open-edge mask (every edge open when omitted)
+
+        Returns:
+            Array of hours shaped (districts, vehicle classes): inf where the
+            class cannot reach the district, NaN where the fleet entry lacks
+            the speed needed to compute a flight time
+        """
+        nodes = np.array([self.index.get(d, -1) for d in district_ids], dtype=np.intp)
+        known = nodes >= 0
+        times = np.full((len(district_ids), len(fleet)), np.inf)
+
+        # Distances per depot, computed once for all entries leaving from it
+        road_hours, air_km = {}, {}
+        for j, vehicle in enumerate(fleet):
+            depot = self.vehicle_depot(vehicle)
+            if not is_air_vehicle(vehicle):
+                if depot not in road_hours:
+                    road_hours[depot] = np.full(len(district_ids), np.inf)
+                    if depot is not None:
+                        road_hours[depot][known] = self.all_pairs(open_mask)[depot, nodes[known]]
+                times[:, j] = LOADING_HOURS + road_hours[depot]
+            elif vehicle.get('speed'):
+                if depot not in air_km:
+                    air_km[depot] = np.full(len(district_ids), np.inf)
+                    if self.coords is not None and depot is not None:
+                        air_km[depot][known] = haversine_km(self.coords[depot], self.coords[nodes[known]])
+                in_range = 2 * air_km[depot] <= vehicle.get('range_km', np.inf)
+                times[:, j] = np.where(in_range, LOADING_HOURS + air_km[depot] / vehicle['speed'], np.inf)
+            else:
+                times[:, j] = np.nan
+        return times
+
+    def vehicle_depot(self, vehicle: Dict) -> Optional[int]:
+        """Node index a fleet entry leaves from: its own `depot`, else the network depot"""
+        depot = vehicle.get('depot')
+        if depot is None:
+            return self.depot
+        if depot not in self.index:
+            raise ValueError(f"Depot {depot} is not a road network node")
+        return self.index[depot]
+
+    def travel_time_table(self, fleet: List[Dict], district_ids: List[str],
+                          open_mask: Optional[np.ndarray] = None) -> Dict[str, Dict[str, float]]:
+        """`vehicle_travel_times` as {district: {fleet key: hours}}, unknown entries left out"""
+        times = self.vehicle_travel_times(fleet, district_ids, open_mask)
+        return {
+            d: {fleet_key(v): float(times[i, j]) for j, v in enumerate(fleet) if not np.isnan(times[i, j])}
+            for i, d in enumerate(district_ids)
+        }
+
+def load_road_network(path: str = ROAD_NETWORK_JSON, depot: Optional[str] = None) -> Optional[RoadNetwork]:
+    """
+    Road network from a graph JSON file
+
+    Returns:
+        RoadNetwork, or None when the file is missing or empty
+    """
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return None
+    with open(path, 'r') as f:
+        return RoadNetwork(json.load(f), depot=depot)
+
+class RoadState:
+    """
+    Per-episode road status over a shared, immutable RoadNetwork
+
+    Each episode is one row of a boolean open-edge array shaped
+    (episodes, edges); the network and its route cache are never modified,
+    so episodes cannot leak failures into each other and the state can be
+    snapshotted as a packed bitmask instead of deep-copying the graph.
+    """
+
+    __slots__ = ("network", "base", "status")
+
+    def __init__(self, network: RoadNetwork, base: Optional[np.ndarray] = None, n_episodes: int = 1):
+        """
+        Args:
+            network: Road network the masks refer to
+            base: Open-edge mask every episode starts from (all open when omitted)
+            n_episodes: Number of episode rows
+        """
+        self.network = network
+        self.base = network.all_open() if base is None else np.asarray(base, dtype=bool).copy()
+        self.base.setflags(write=False)
+        self.status = np.tile(self.base, (n_episodes, 1))
+
+    @property
+    def n_episodes(self) -> int:
+        return self.status.shape[0]
+
+    def reset(self):
+        """Return every episode to the base status"""
+        self.status[:] = self.base
+
+    def snapshot(self) -> np.ndarray:
+        """Packed bitmask of the current status, one byte per 8 edges and episode"""
+        return np.packbits(self.status, axis=1)
+
+    def restore(self, snapshot: np.ndarray):
+        """Restore a status captured with `snapshot`"""
+        self.status = np.unpackbits(snapshot, axis=1, count=self.network.n_edges).astype(bool)
+
+    def vehicle_travel_times(self, fleet: List[Dict], district_ids: List[str]) -> np.ndarray:
+        """
+        `RoadNetwork.vehicle_travel_times` for every episode
+
+        Episodes sharing a road status share one lookup, so the cost grows
+        with the number of distinct graph versions, not with episodes.
+
+        Returns:
+            Hours shaped (episodes, districts, vehicle classes)
+        """
+        versions, inverse = np.unique(self.status, axis=0, return_inverse=True)
+        tables = np.stack([self.network.vehicle_travel_times(fleet, district_ids, mask) for mask in versions])
+        return tables[inverse.reshape(-1)]
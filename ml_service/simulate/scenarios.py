@@ -0,0 +1,282 @@
+import hashlib
+import json
+import os
+import numpy as np
+import pandas as pd
+from typing import Dict, List, Optional
+import logging
+
+from simulate.random_streams import episode_streams
+
+logger = logging.getLogger(__name__)
+
+# Bump when the demand model or its random draws change, so cached tensors
+# generated by an older version are never reused
+DEMAND_GENERATOR_VERSION = 1
+
+# Scenario fields that influence generated demand
+DEMAND_KEYS = ("seed", "periods", "period_hours", "shock_times", "shock_multipliers", "districts")
+
+# Cached demand tensors are evicted least recently used first beyond this size
+DEMAND_CACHE_MAX_BYTES = 4 << 30
+
+PROCESSED_DATA_DIR = os.path.join(os.path.dirname(__file__), '..', '..', 'data', 'processed')
+FLOOD_IMPACT_CSV = os.path.join(PROCESSED_DATA_DIR, 'District_FloodImpact.csv')
+FLOOD_AREA_CSV = os.path.join(PROCESSED_DATA_DIR, 'District_FloodedArea.csv')
+
+def load_flood_districts(impact_csv: str = FLOOD_IMPACT_CSV, area_csv: str = FLOOD_AREA_CSV,
+                         limit: Optional[int] = None) -> Dict:
+    """
+    Load the Indian district set from the processed flood data
+
+    The two CSVs list the same districts in the same order (names alone are
+    not unique across states), so they are joined row by row. Demand scale
+    mixes population and corrected flooded-area share, each normalised to a
+    mean of 1, so the national mean matches the synthetic 5-district setup.
+
+    Args:
+        impact_csv: Path to District_FloodImpact.csv
+        area_csv: Path to District_FloodedArea.csv
+        limit: Only keep the first `limit` districts
+
+    Returns:
+        Dictionary with `district_ids`, `names`, `population`,
+        `flooded_area_pct` and `demand_scale` (arrays aligned with the ids)
+    """
+    impact = pd.read_csv(impact_csv)
+    area = pd.read_csv(area_csv)
+
+    if len(impact) != len(area) or not (impact['Dist_Name'] == area['Dist_Name']).all():
+        raise ValueError(f"District rows of {impact_csv} and {area_csv} do not line up")
+
+    if limit is not None:
+        impact = impact.head(limit)
+        area = area.head(limit)
+
+    population = impact['Population'].to_numpy(dtype=float)
+    flooded_pct = area['Corrected_Percent_Flooded_Area'].to_numpy(dtype=float)
+
+    demand_scale = 0.5 * population / population.mean() + 0.5 * flooded_pct / flooded_pct.mean()
+
+    return {
+        "district_ids": [f"D{i:03d}" for i in range(1, len(impact) + 1)],
+        "names": impact['Dist_Name'].str.strip().tolist(),
+        "population": population,
+        "flooded_area_pct": flooded_pct,
+        "demand_scale": demand_scale
+    }
+
+def load_scenario_districts(scenario: Dict) -> Optional[Dict]:
+    """
+    District set configured by the scenario's `districts` entry
+
+    `{"source": "flood_data", "limit": N}` loads the processed flood data
+    (optionally with `impact_csv` / `area_csv` paths); without a `districts`
+    entry the engine keeps its built-in synthetic districts and None is returned.
+    """
+    config = scenario.get('districts')
+    if not config:
+        return None
+
+    source = config.get('source')
+    if source != 'flood_data':
+        raise ValueError(f"Unknown district source: {source}")
+
+    return load_flood_districts(
+        impact_csv=config.get('impact_csv', FLOOD_IMPACT_CSV),
+        area_csv=config.get('area_csv', FLOOD_AREA_CSV),
+        limit=config.get('limit')
+    )
+
+def demand_profile(scenario: Dict, district_ids: List[str],
+                   demand_scale: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Deterministic demand multipliers for every period and district
+
+    Combines the daily seasonal factor with the scenario's surge multipliers
+    and each district's demand scale, so demand draws only need one
+    multiplication per episode. With `period_hours` other than 1 the
+    seasonality follows the clock and demand scales with period length.
+
+    Args:
+        scenario: Scenario configuration
+        district_ids: District ordering of the columns
+        demand_scale: Per-district demand scale (1.0 everywhere when omitted)
+
+    Returns:
+        Array of multipliers shaped (periods, districts)
+    """
+    periods = scenario.get('periods', 24)
+    period_hours = scenario.get('period_hours', 1.0)
+
+    # Daily seasonality, peak around noon
+    hour_of_day = (np.arange(periods) * period_hours) % 24
+    seasonal_factor = 1.0 + 0.3 * np.sin(2 * np.pi * hour_of_day / 24)
+
+    shock_config = scenario.get('shock_multipliers', {})
+    shock_mults = dict(zip(shock_config.get('districts', []), shock_config.get('mult', [])))
+    district_mults = np.array([shock_mults.get(d, 1.0) for d in district_ids], dtype=float)
+
+    shock_periods = np.zeros(periods, dtype=bool)
+    shock_times = [t for t in scenario.get('shock_times', []) if 0 <= t < periods]
+    shock_periods[shock_times] = True
+
+    profile = seasonal_factor[:, None] * np.where(shock_periods[:, None], district_mults[None, :], 1.0)
+    if demand_scale is not None:
+        profile = profile * demand_scale[None, :]
+    if period_hours != 1.0:
+        profile = profile * period_hours
+    return profile
+
+def draw_demand_trajectory(rng: np.random.Generator, profile: np.ndarray) -> np.ndarray:
+    """
+    Draw a whole episode of demand from the episode's demand stream
+
+    Args:
+        rng: Demand random stream of the episode
+        profile: Demand multipliers from `demand_profile`
+
+    Returns:
+        Demand array shaped (periods, districts)
+    """
+    base_demand = rng.gamma(2, 5, profile.shape) * profile
+    return np.maximum(0, base_demand + rng.normal(0, 2, profile.shape))
+
+def generate_demand_tensor(scenario: Dict, district_ids: List[str], episodes: List[int],
+                           demand_scale: Optional[np.ndarray] = None,
+                           out: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Generate demand for many episodes
+
+    Each episode draws from its own demand stream, so any episode's slice is
+    identical no matter which range it was generated in.
+
+    Args:
+        scenario: Scenario configuration
+        district_ids: District ordering of the last axis
+        episodes: Episode numbers
+        demand_scale: Per-district demand scale
+        out: Array to fill episode by episode instead of allocating one
+            (e.g. a memory-mapped cache file)
+
+    Returns:
+        Demand tensor shaped (episodes, periods, districts)
+    """
+    seed = scenario.get('seed', 42)
+    profile = demand_profile(scenario, district_ids, demand_scale)
+
+    tensor = np.empty((len(episodes),) + profile.shape) if out is None else out
+    for i, episode in enumerate(episodes):
+        tensor[i] = draw_demand_trajectory(episode_streams(seed, episode)['demand'], profile)
+    return tensor
+
+def scenario_hash(scenario: Dict, district_ids: List[str], keys=DEMAND_KEYS) -> str:
+    """Stable short hash of the scenario fields (and district set) that determine demand"""
+    payload = {
+        "version": DEMAND_GENERATOR_VERSION,
+        "districts": list(district_ids),
+        "scenario": {key: scenario.get(key) for key in keys}
+    }
+    encoded = json.dumps(payload, sort_keys=True, default=str).encode()
+    return hashlib.sha256(encoded).hexdigest()[:16]
+
+def demand_cache_path(cache_dir: str, scenario: Dict, district_ids: List[str],
+                      start: int, stop: int) -> str:
+    """Cache file for the demand of episodes [start, stop)"""
+    key = scenario_hash(scenario, district_ids)
+    seed = scenario.get('seed', 42)
+    return os.path.join(cache_dir, f"demand_{key}_seed{seed}_ep{start}-{stop}.npy")
+
+def load_demand_tensor(scenario: Dict, district_ids: List[str], episodes: List[int],
+                       cache_dir: Optional[str] = None,
+                       demand_scale: Optional[np.ndarray] = None,
+                       max_bytes: int = DEMAND_CACHE_MAX_BYTES) -> np.ndarray:
+    """
+    Demand tensor for a contiguous episode range, memory-mapped from the cache
+
+    The first request for a scenario/seed/range generates the tensor straight
+    into a memory-mapped file, one episode at a time, so it never has to fit
+    in memory; later requests (other policies, API calls, processes) map the
+    saved file and skip demand generation entirely.
+
+    Args:
+        scenario: Scenario configuration
+        district_ids: District ordering of the last axis
+        episodes: Episode numbers
+        cache_dir: Cache directory (no caching when None)
+        demand_scale: Per-district demand scale; it is derived from the
+            scenario's `districts` entry, which is part of the cache key
+        max_bytes: Size bound of the cache directory (`evict_demand_cache`)
+
+    Returns:
+        Demand tensor shaped (episodes, periods, districts)
+    """
+    episodes = list(episodes)
+    contiguous = bool(episodes) and episodes == list(range(episodes[0], episodes[0] + len(episodes)))
+
+    if cache_dir is None or not contiguous:
+        return generate_demand_tensor(scenario, district_ids, episodes, demand_scale)
+
+    path = demand_cache_path(cache_dir, scenario, district_ids, episodes[0], episodes[0] + len(episodes))
+    if os.path.exists(path):
+        logger.debug(f"Demand cache hit: {path}")
+        try:
+            # Last use orders the eviction
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+        else:
+            return np.load(path, mmap_mode='r')
+
+    # Fill a temporary file first so concurrent readers never see a partial file
+    os.makedirs(cache_dir, exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    shape = (len(episodes),) + demand_profile(scenario, district_ids, demand_scale).shape
+    tensor = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=float, shape=shape)
+    generate_demand_tensor(scenario, district_ids, episodes, demand_scale, out=tensor)
+    tensor.flush()
+    del tensor
+    os.replace(tmp_path, path)
+    logger.info(f"Demand tensor cached at {path}")
+    evict_demand_cache(cache_dir, max_bytes, keep=path)
+
+    return np.load(path, mmap_mode='r')
+
+def evict_demand_cache(cache_dir: str, max_bytes: int = DEMAND_CACHE_MAX_BYTES, keep: Optional[str] = None):
+    """
+    Delete least recently used demand tensors until the cache fits `max_bytes`
+
+    Processes that still map a deleted tensor keep reading it; the next
+    request for its range generates it again.
+
+    Args:
+        cache_dir: Cache directory
+        max_bytes: Size bound of the cached tensors
+        keep: Tensor never evicted (the one just written)
+    """
+    files = []
+    for name in os.listdir(cache_dir):
+        if not (name.startswith("demand_") and name.endswith(".npy")):
+            continue
+        path = os.path.join(cache_dir, name)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            continue
+        files.append((stat.st_mtime, stat.st_size, path))
+
+    excess = sum(size for _, size, _ in files) - max_bytes
+    evicted = 0
+    for _, size, path in sorted(files):
+        if excess <= 0:
+            break
+        if path == keep:
+            continue
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        excess -= size
+        evicted += 1
+    if evicted:
+        logger.info(f"Evicted {evicted} cached demand tensors")
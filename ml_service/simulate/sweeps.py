@@ -0,0 +1,110 @@
+import copy
+import itertools
+import warnings
+import numpy as np
+from typing import Any, Dict, List, Optional
+
+DESIGNS = ("grid", "lhs", "sobol")
+
+# Levels of a {"low", "high"} range in a grid design when `levels` is not given
+DEFAULT_GRID_LEVELS = 3
+
+def expand_design(parameter_variations: Dict[str, Any], design: str = "grid",
+                  n_samples: Optional[int] = None, seed: int = 0) -> List[Dict[str, Any]]:
+    """
+    Expand parameter variations into the list of sweep points
+
+    Parameters are dotted scenario paths (see `apply_parameters`). Each one is
+    either a list of levels or a range {"low": a, "high": b}, optionally with
+    "integer": true and, for grids, "levels": n.
+
+    Args:
+        parameter_variations: Dictionary mapping parameter path to its variation
+        design: 'grid' (full factorial), 'lhs' (Latin hypercube) or 'sobol'
+            (scrambled Sobol sequence); the sampled designs draw ranges
+            continuously and pick list levels by the sampled coordinate
+        n_samples: Points of a sampled design (defaults to 10 per parameter)
+        seed: Seed of the sampled designs
+
+    Returns:
+        List of {parameter path: value} dictionaries
+    """
+    if design not in DESIGNS:
+        raise ValueError(f"Unknown design: {design} (expected one of {DESIGNS})")
+    names = list(parameter_variations)
+    if not names:
+        return [{}]
+    specs = [parameter_variations[name] for name in names]
+
+    if design == "grid":
+        levels = [_grid_levels(name, spec) for name, spec in zip(names, specs)]
+        return [dict(zip(names, point)) for point in itertools.product(*levels)]
+
+    from scipy.stats import qmc
+
+    n_samples = n_samples or 10 * len(names)
+    if design == "lhs":
+        unit = qmc.LatinHypercube(d=len(names), seed=seed).random(n_samples)
+    else:
+        with warnings.catch_warnings():
+            # Sobol balance properties hold for powers of two; other sizes are still usable
+            warnings.simplefilter("ignore", UserWarning)
+            unit = qmc.Sobol(d=len(names), scramble=True, seed=seed).random(n_samples)
+
+    columns = [_scale_unit(name, spec, unit[:, j]) for j, (name, spec) in enumerate(zip(names, specs))]
+    return [dict(zip(names, point)) for point in zip(*columns)]
+
+def apply_parameters(scenario: Dict, parameters: Dict[str, Any]) -> Dict:
+    """
+    Scenario copy with parameter values set at their dotted paths
+
+    Path segments index dictionaries by key (missing levels are created) and
+    lists by position, e.g. 'periods', 'shock_multipliers.mult.0',
+    'fleet.small_truck.count' or 'failure_prob_scale'.
+
+    Args:
+        scenario: Base scenario configuration
+        parameters: Dictionary mapping parameter path to value
+
+    Returns:
+        New scenario dictionary
+    """
+    scenario = copy.deepcopy(scenario)
+    for path, value in parameters.items():
+        *parents, leaf = path.split(".")
+        node = scenario
+        for key in parents:
+            if isinstance(node, list):
+                node = node[int(key)]
+            else:
+                node = node.setdefault(key, {})
+        if isinstance(node, list):
+            node[int(leaf)] = value
+        else:
+            node[leaf] = value
+    return scenario
+
+def _grid_levels(name: str, spec: Any) -> List[Any]:
+    if isinstance(spec, dict):
+        _check_range(name, spec)
+        values = np.linspace(spec['low'], spec['high'], spec.get('levels', DEFAULT_GRID_LEVELS))
+        if spec.get('integer'):
+            return sorted(set(int(round(v)) for v in values))
+        return [float(v) for v in values]
+    return list(spec)
+
+def _scale_unit(name: str, spec: Any, unit: np.ndarray) -> List[Any]:
+    """Map unit-interval samples onto a parameter's range or levels"""
+    if isinstance(spec, dict):
+        _check_range(name, spec)
+        low, high = spec['low'], spec['high']
+        if spec.get('integer'):
+            # Equal-width bins for every integer of [low, high]
+            return [int(v) for v in np.floor(low + unit * (high - low + 1)).clip(low, high)]
+        return [float(v) for v in low + unit * (high - low)]
+    levels = list(spec)
+    return [levels[i] for i in np.minimum((unit * len(levels)).astype(int), len(levels) - 1)]
+
+def _check_range(name: str, spec: Dict):
+    if 'low' not in spec or 'high' not in spec:
+        raise ValueError(f"Range of parameter '{name}' needs 'low' and 'high'")
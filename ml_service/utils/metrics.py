@@ -0,0 +1,397 @@
+import numpy as np
+from scipy import stats
+from typing import Dict, List, Optional, Sequence
+
+# Episode result fields policies are compared on, by direction
+LOWER_IS_BETTER_METRICS = frozenset({"total_cost", "mean_deprivation", "max_deprivation"})
+HIGHER_IS_BETTER_METRICS = frozenset({"demand_coverage", "satisfied_demand"})
+
+def metric_higher_is_better(metric: str, higher_is_better: Optional[bool] = None) -> bool:
+    """
+    Direction of a comparison metric
+
+    Args:
+        metric: Episode result field
+        higher_is_better: Explicit direction; None looks the metric up in
+            LOWER_IS_BETTER_METRICS and HIGHER_IS_BETTER_METRICS
+
+    Raises:
+        ValueError: If the direction is not given and the metric is in neither list
+    """
+    if higher_is_better is not None:
+        return higher_is_better
+    if metric in HIGHER_IS_BETTER_METRICS:
+        return True
+    if metric in LOWER_IS_BETTER_METRICS:
+        return False
+    raise ValueError(f"Unknown direction of metric '{metric}'; pass higher_is_better")
+
+def paired_difference_ci(a: Sequence[float], b: Sequence[float], confidence: float = 0.95) -> Dict:
+    """
+    Confidence interval for the mean of paired differences a - b
+
+    Both samples must come from the same episodes (common random numbers), so
+    the per-episode difference cancels the noise the two runs share.
+
+    Args:
+        a: Per-episode metric for the first policy
+        b: Per-episode metric for the second policy, same episode order
+        confidence: Two-sided confidence level
+
+    Returns:
+        Dictionary with mean difference, standard error, interval bounds,
+        p-value, whether the difference is significant and the variance
+        reduction factor against an unpaired comparison
+    """
+    a = np.asarray(a, dtype=float)
+    b = np.asarray(b, dtype=float)
+    if a.shape != b.shape:
+        raise ValueError(f"Paired samples differ in length: {len(a)} vs {len(b)}")
+
+    n = len(a)
+    diff = a - b
+    mean_diff = float(np.mean(diff)) if n else 0.0
+
+    if n < 2:
+        return {
+            "n": n,
+            "mean_diff": mean_diff,
+            "std_err": float('nan'),
+            "ci_low": float('nan'),
+            "ci_high": float('nan'),
+            "p_value": float('nan'),
+            "significant": False,
+            "variance_reduction": float('nan')
+        }
+
+    diff_var = float(np.var(diff, ddof=1))
+    std_err = float(np.sqrt(diff_var / n))
+
+    if std_err > 0:
+        half_width = float(stats.t.ppf(0.5 + confidence / 2, n - 1)) * std_err
+        p_value = float(2 * stats.t.sf(abs(mean_diff) / std_err, n - 1))
+    else:
+        # Identical differences in every episode: the sign is certain
+        half_width = 0.0
+        p_value = 0.0 if mean_diff != 0 else 1.0
+
+    # Variance of an unpaired difference of means relative to the paired one
+    unpaired_var = float(np.var(a, ddof=1) + np.var(b, ddof=1))
+    variance_reduction = unpaired_var / diff_var if diff_var > 0 else float('inf')
+
+    return {
+        "n": n,
+        "mean_diff": mean_diff,
+        "std_err": std_err,
+        "ci_low": mean_diff - half_width,
+        "ci_high": mean_diff + half_width,
+        "p_value": p_value,
+        "significant": bool(p_value < 1 - confidence),
+        "variance_reduction": variance_reduction
+    }
+
+def paired_policy_ranking(samples: Dict[str, List[float]], confidence: float = 0.95,
+                          baseline: Optional[str] = None, higher_is_better: bool = False) -> Dict:
+    """
+    Rank policies on a paired per-episode metric
+
+    Args:
+        samples: Dictionary mapping policy to its per-episode metric, all in
+            the same episode order
+        confidence: Two-sided confidence level
+        baseline: Policy every other policy is compared against (defaults to
+            the best-ranked policy)
+        higher_is_better: Rank the largest mean first instead of the smallest.
+            Differences stay in the metric's own units (policy - baseline,
+            worse - better)
+
+    Returns:
+        Dictionary with the ranking, differences against the baseline,
+        differences between adjacent ranks and whether the whole ranking is
+        statistically significant
+    """
+    sign = -1 if higher_is_better else 1
+    ranking = sorted(samples, key=lambda p: sign * np.mean(samples[p]))
+    if not ranking:
+        return {"ranking": [], "higher_is_better": higher_is_better, "baseline": baseline,
+                "vs_baseline": {}, "adjacent": [], "significant_ranking": False}
+
+    baseline = baseline if baseline in samples else ranking[0]
+
+    vs_baseline = {
+        policy: paired_difference_ci(samples[policy], samples[baseline], confidence)
+        for policy in ranking if policy != baseline
+    }
+
+    adjacent = []
+    for better, worse in zip(ranking, ranking[1:]):
+        comparison = paired_difference_ci(samples[worse], samples[better], confidence)
+        adjacent.append({"better": better, "worse": worse, **comparison})
+
+    return {
+        "ranking": ranking,
+        "higher_is_better": higher_is_better,
+        "baseline": baseline,
+        "vs_baseline": vs_baseline,
+        "adjacent": adjacent,
+        "significant_ranking": all(c["significant"] for c in adjacent)
+    }
+
+class RunningStats:
+    """
+    Constant-memory mean/variance (Welford) with min and max
+
+    Two accumulators merge exactly (Chan et al.), so partial results from
+    separate workers or runs combine into the statistics of the whole sample.
+    """
+
+    __slots__ = ("count", "mean", "m2", "min", "max")
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+        self.min = float('inf')
+        self.max = float('-inf')
+
+    def update(self, value: float):
+        """Add one observation"""
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self.m2 += delta * (value - self.mean)
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+
+    def update_batch(self, values: Sequence[float]):
+        """Add many observations at once"""
+        values = np.asarray(values, dtype=float).ravel()
+        if len(values) == 0:
+            return
+        batch = RunningStats()
+        batch.count = len(values)
+        batch.mean = float(values.mean())
+        batch.m2 = float(((values - batch.mean) ** 2).sum())
+        batch.min = float(values.min())
+        batch.max = float(values.max())
+        self.merge(batch)
+
+    def merge(self, other: "RunningStats") -> "RunningStats":
+        """Fold another accumulator into this one (returns self)"""
+        if other.count == 0:
+            return self
+        if self.count == 0:
+            self.count, self.mean, self.m2 = other.count, other.mean, other.m2
+            self.min, self.max = other.min, other.max
+            return self
+
+        count = self.count + other.count
+        delta = other.mean - self.mean
+        self.mean += delta * other.count / count
+        self.m2 += other.m2 + delta * delta * self.count * other.count / count
+        self.count = count
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        return self
+
+    def half_width(self, confidence: float = 0.95) -> float:
+        """Half-width of the t confidence interval of the mean (inf below two observations)"""
+        if self.count < 2:
+            return float('inf')
+        return float(stats.t.ppf(0.5 + confidence / 2, self.count - 1)) * self.std(ddof=1) / np.sqrt(self.count)
+
+    def variance(self, ddof: int = 0) -> float:
+        """Sample variance (population variance with the default ddof=0)"""
+        if self.count <= ddof:
+            return float('nan')
+        return self.m2 / (self.count - ddof)
+
+    def std(self, ddof: int = 0) -> float:
+        return float(np.sqrt(self.variance(ddof)))
+
+class TDigest:
+    """
+    Mergeable quantile sketch (merging t-digest)
+
+    Observations are buffered and, once more than `buffer_size` centroids
+    pile up, merged into at most about `compression` centroids with the
+    arcsine scale function, which keeps the tails (p90, p95, p99) sharp.
+    The default compression keeps about 250 centroids, within about 0.5% of
+    the exact p99 on skewed cost distributions.
+    Until the first compression every observation is its own centroid and
+    quantiles equal `np.percentile` with linear interpolation.
+    """
+
+    def __init__(self, compression: float = 500, buffer_size: int = 1000):
+        """
+        Args:
+            compression: Centroid budget; higher is more accurate
+            buffer_size: Centroids kept before compressing
+        """
+        self.compression = compression
+        self.buffer_size = max(buffer_size, int(compression))
+        self.means = np.empty(0)
+        self.weights = np.empty(0)
+        self._buffer: List[float] = []
+        self.min = float('inf')
+        self.max = float('-inf')
+
+    @property
+    def count(self) -> float:
+        return float(self.weights.sum()) + len(self._buffer)
+
+    def update(self, value: float):
+        """Add one observation"""
+        self._buffer.append(float(value))
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+        if len(self._buffer) + len(self.means) > self.buffer_size:
+            self._flush()
+
+    def update_batch(self, values: Sequence[float]):
+        """Add many observations at once"""
+        values = np.asarray(values, dtype=float).ravel()
+        if len(values) == 0:
+            return
+        self._flush()
+        self._add_centroids(values, np.ones(len(values)))
+        self.min = min(self.min, float(values.min()))
+        self.max = max(self.max, float(values.max()))
+
+    def merge(self, other: "TDigest") -> "TDigest":
+        """Fold another digest into this one (returns self)"""
+        other._flush()
+        self._flush()
+        if len(other.means):
+            self._add_centroids(other.means, other.weights)
+            self.min = min(self.min, other.min)
+            self.max = max(self.max, other.max)
+            # Centroids of two digests overlap, which blurs the interpolation,
+            # so re-merge once there are more than one digest's worth
+            if len(self.means) > self.compression / 2:
+                self._compress()
+        return self
+
+    def quantile(self, q: float) -> float:
+        """
+        Estimated quantile
+
+        Args:
+            q: Quantile in [0, 1]
+        """
+        self._flush()
+        if not len(self.means):
+            return float('nan')
+
+        # Rank of each centroid's centre on the 0..n-1 scale np.percentile uses;
+        # singleton centroids sit exactly on their order statistic
+        before = np.cumsum(self.weights) - self.weights
+        centres = before + (self.weights - 1) / 2
+        rank = q * (self.weights.sum() - 1)
+        points = np.concatenate([[0.0], centres, [self.weights.sum() - 1]])
+        values = np.concatenate([[self.min], self.means, [self.max]])
+        return float(np.interp(rank, points, values))
+
+    def _flush(self):
+        if self._buffer:
+            buffer = np.asarray(self._buffer)
+            self._buffer = []
+            self._add_centroids(buffer, np.ones(len(buffer)))
+
+    def _add_centroids(self, means: np.ndarray, weights: np.ndarray):
+        means = np.concatenate([self.means, means])
+        weights = np.concatenate([self.weights, weights])
+        order = np.argsort(means, kind='stable')
+        self.means, self.weights = means[order], weights[order]
+        if len(self.means) > self.buffer_size:
+            self._compress()
+
+    def _compress(self):
+        """Merge neighbouring centroids that share a unit of the scale function"""
+        total = self.weights.sum()
+        middle = (np.cumsum(self.weights) - self.weights / 2) / total
+        k = self.compression / (2 * np.pi) * np.arcsin(2 * middle - 1)
+        group = np.floor(k - k[0]).astype(int)
+        starts = np.flatnonzero(np.r_[True, group[1:] != group[:-1]])
+
+        weights = np.add.reduceat(self.weights, starts)
+        self.means = np.add.reduceat(self.means * self.weights, starts) / weights
+        self.weights = weights
+
+class EpisodeSummary:
+    """
+    Streaming aggregate of episode results
+
+    Keeps running statistics of cost, deprivation and coverage plus a cost
+    quantile digest, so a summary needs constant memory whatever the number
+    of episodes. Summaries of disjoint episode sets merge.
+    """
+
+    def __init__(self):
+        self.cost = RunningStats()
+        self.cost_quantiles = TDigest()
+        self.deprivation = RunningStats()
+        self.max_deprivation = RunningStats()
+        self.coverage = RunningStats()
+
+    @property
+    def episodes(self) -> int:
+        return self.cost.count
+
+    def metric(self, name: str) -> RunningStats:
+        """Running statistics of an episode result field"""
+        metrics = {
+            "total_cost": self.cost,
+            "mean_deprivation": self.deprivation,
+            "max_deprivation": self.max_deprivation,
+            "demand_coverage": self.coverage
+        }
+        if name not in metrics:
+            raise ValueError(f"Unknown summary metric: {name} (expected one of {sorted(metrics)})")
+        return metrics[name]
+
+    def update(self, result: Dict):
+        """Add one episode result dictionary"""
+        self.cost.update(result['total_cost'])
+        self.cost_quantiles.update(result['total_cost'])
+        self.deprivation.update(result['mean_deprivation'])
+        self.max_deprivation.update(result.get('max_deprivation', 0))
+        self.coverage.update(result['demand_coverage'])
+
+    def merge(self, other: "EpisodeSummary") -> "EpisodeSummary":
+        """Fold the summary of other episodes into this one (returns self)"""
+        self.cost.merge(other.cost)
+        self.cost_quantiles.merge(other.cost_quantiles)
+        self.deprivation.merge(other.deprivation)
+        self.max_deprivation.merge(other.max_deprivation)
+        self.coverage.merge(other.coverage)
+        return self
+
+    def to_dict(self, policy: str, scenario: str) -> Dict:
+        """
+        Policy summary dictionary
+
+        Args:
+            policy: Policy name
+            scenario: Scenario name
+        """
+        if not self.episodes:
+            return {
+                "policy": policy,
+                "episodes": 0,
+                "error": "No episodes completed successfully"
+            }
+        return {
+            "policy": policy,
+            "episodes": self.episodes,
+            "mean_cost": self.cost.mean,
+            "std_cost": self.cost.std(),
+            "median_cost": self.cost_quantiles.quantile(0.5),
+            "p90_cost": self.cost_quantiles.quantile(0.9),
+            "p95_cost": self.cost_quantiles.quantile(0.95),
+            "mean_deprivation": self.deprivation.mean,
+            "max_deprivation": self.max_deprivation.mean,
+            "demand_coverage": self.coverage.mean,
+            "min_coverage": self.coverage.min,
+            "scenario": scenario
+        }
@@ -2,6 +2,7 @@
 import pytest
 import requests
 import json
+import numpy as np
 from fastapi.testclient import TestClient
 import sys
 import os
@@ -78,6 +79,7 @@ import sys
 import os
 sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'ml_service'))
 
+from ortools.linear_solver import pywraplp
 from optimize.mip_solver import solve_allocation_mip
 
 def test_mip_solver():
@@ -115,3 +117,296 @@ def test_mip_with_constraints():
     # Should have no allocations to locked out district
     d001_allocations = [a for a in result["allocations"] if a["district"] == "D001"]
     assert len(d001_allocations) == 0
+
+def test_district_state_table_conversion():
+    from main import DistrictState
+    states = [
+        DistrictState(district_id="D001", inventory=100, demand_last_period=15,
+                      backlog=20, avg_deprivation_time=2.5, road_access="open")
+    ]
+    table = DistrictState.to_table(states)
+    assert table.backlog.shape == (1, 1)
+    assert DistrictState.from_table(table) == states
+
+def test_simulation_job_lifecycle(tmp_path, monkeypatch):
+    import main
+    from simulate.jobs import JobQueue, JobStore
+
+    monkeypatch.chdir(tmp_path)
+    scenario = tmp_path / "jobs.json"
+    scenario.write_text(json.dumps({"name": "jobs", "seed": 3, "periods": 6}))
+    queue = JobQueue(JobStore(str(tmp_path / "jobs.sqlite")), n_workers=1)
+    monkeypatch.setattr(main, "job_queue", queue)
+
+    response = client.post("/simulate", json={"scenario": str(scenario), "policy": "heuristic", "n_episodes": 4})
+    assert response.status_code == 202
+    job_id = response.json()["job_id"]
+
+    queue.wait(job_id, timeout=120)
+    status = client.get(f"/simulate/jobs/{job_id}").json()
+    assert status["status"] == "completed"
+    assert status["progress"] == status["total"] == 4
+
+    result = client.get(f"/simulate/jobs/{job_id}/result").json()
+    assert result["results_summary"]["episodes"] == 4
+    assert [job["job_id"] for job in client.get("/simulate/jobs").json()] == [job_id]
+    assert client.get("/simulate/jobs/unknown").status_code == 404
+    queue.shutdown()
+
+def test_cancelled_queued_job_never_runs(tmp_path):
+    from simulate.jobs import JobStore, run_simulation_job
+
+    store = JobStore(str(tmp_path / "jobs.sqlite"))
+    job_id = store.create("simulate", {"scenario": "unused.json", "policy": "heuristic", "n_episodes": 1})
+    assert store.request_cancel(job_id)["status"] == "cancelled"
+
+    run_simulation_job(store.db_path, job_id)
+    job = store.get(job_id)
+    assert job["status"] == "cancelled"
+    assert job["started_at"] is None
+    assert job["result"] is None
+
+def test_recover_only_fails_jobs_of_exited_processes(tmp_path):
+    import subprocess
+    from simulate.jobs import JobStore
+
+    store = JobStore(str(tmp_path / "jobs.sqlite"))
+    exited = subprocess.Popen([sys.executable, "-c", "pass"])
+    exited.wait()
+    live_job = store.create("simulate", {"n_episodes": 1})
+    orphan_job = store.create("simulate", {"n_episodes": 1})
+    store._execute("UPDATE jobs SET owner_pid = ? WHERE id = ?", (exited.pid, orphan_job))
+
+    assert store.recover() == 1
+    assert store.get(orphan_job)["status"] == "failed"
+    assert store.get(live_job)["status"] == "queued"
+
+def _rolling_inputs(n_periods, n_districts=12, seed=0):
+    rng = np.random.default_rng(seed)
+    for _ in range(n_periods):
+        state = {f"D{i:03d}": {"inventory": 100, "backlog": float(rng.uniform(0, 50)),
+                               "demand_last_period": float(rng.uniform(0, 50))}
+                 for i in range(n_districts)}
+        yield state, {d: float(rng.normal(-100, 60)) for d in state}
+
+ROLLING_FLEET = [
+    {"class": "small_truck", "capacity": 100, "count": 5, "cost_per_hour": 50},
+    {"class": "uav_light", "capacity": 10, "count": 8, "cost_per_hour": 25}
+]
+
+def test_mip_session_is_reused_and_warm_started():
+    from optimize.mip_solver import clear_sessions
+
+    clear_sessions()
+    constraints = {"lock_out": ["D002"], "vehicle_limits": {"small_truck": 3}}
+    results = [solve_allocation_mip(state, vfa, ROLLING_FLEET, constraints, method="mip")
+               for state, vfa in _rolling_inputs(4)]
+    fresh = [solve_allocation_mip(state, vfa, ROLLING_FLEET, constraints, reuse_session=False, method="mip")
+             for state, vfa in _rolling_inputs(4)]
+
+    assert [r["solve_info"]["warm_start"] for r in results] == [False, True, True, True]
+    assert results[-1]["solve_info"]["session_solves"] == 4
+    assert [r["objective"] for r in results] == pytest.approx([r["objective"] for r in fresh])
+    for result in results:
+        assert all(a["district"] != "D002" for a in result["allocations"])
+        assert sum(a["count"] for a in result["allocations"] if a["truck_class"] == "small_truck") <= 3
+
+def test_mip_session_unlocks_a_locked_out_district():
+    from optimize.mip_solver import clear_sessions
+
+    clear_sessions()
+    state, vfa = next(_rolling_inputs(1))
+    # D000 is the most valuable district to serve
+    vfa["D000"] = -1000.0
+    unlocked = solve_allocation_mip(state, vfa, ROLLING_FLEET, reuse_session=False)
+    assert any(a["district"] == "D000" for a in unlocked["allocations"])
+
+    locked = solve_allocation_mip(state, vfa, ROLLING_FLEET, {"lock_out": ["D000"]}, method="mip")
+    reopened = solve_allocation_mip(state, vfa, ROLLING_FLEET, {"lock_out": []}, method="mip")
+
+    assert all(a["district"] != "D000" for a in locked["allocations"])
+    assert reopened["solve_info"]["warm_start"]
+    assert reopened["objective"] == pytest.approx(unlocked["objective"])
+    assert any(a["district"] == "D000" for a in reopened["allocations"])
+
+def test_greedy_fast_path_matches_mip():
+    constraints = {"lock_out": ["D002"], "vehicle_limits": {"small_truck": 3}}
+    for state, vfa in _rolling_inputs(5, n_districts=30, seed=1):
+        greedy = solve_allocation_mip(state, vfa, ROLLING_FLEET, constraints)
+        mip = solve_allocation_mip(state, vfa, ROLLING_FLEET, constraints, method="mip")
+        assert greedy["solve_info"]["method"] == "greedy"
+        assert greedy["objective"] == pytest.approx(mip["objective"])
+        assert all(a["district"] != "D002" for a in greedy["allocations"])
+        assert sum(a["count"] for a in greedy["allocations"] if a["truck_class"] == "small_truck") <= 3
+
+    # Unknown side constraints need the MIP
+    state, vfa = next(_rolling_inputs(1))
+    result = solve_allocation_mip(state, vfa, ROLLING_FLEET, {"min_coverage": 0.5})
+    assert result["solve_info"]["method"] == "mip"
+    with pytest.raises(ValueError):
+        solve_allocation_mip(state, vfa, ROLLING_FLEET, {"min_coverage": 0.5}, method="greedy")
+
+def test_decomposed_solve_bounds_the_mip():
+    rng = np.random.default_rng(2)
+    fleet = [dict(vehicle, depot=depot) for depot in ("north", "south") for vehicle in ROLLING_FLEET]
+    state, vfa = next(_rolling_inputs(1, n_districts=60, seed=2))
+    constraints = {"lock_out": ["D002"], "district_capacity": {d: int(rng.integers(0, 3)) for d in state}}
+
+    decomposed = solve_allocation_mip(state, vfa, fleet, constraints, method="decomposed", relative_gap=1e-4)
+    mip = solve_allocation_mip(state, vfa, fleet, constraints, method="mip")
+
+    info = decomposed["solve_info"]
+    assert info["method"] == "decomposed"
+    assert info["bound"] <= mip["objective"] + 1e-6 <= decomposed["objective"] + 2e-6
+    assert decomposed["objective"] - info["bound"] <= 1e-4 * abs(decomposed["objective"]) + 1e-6
+    for d, limit in constraints["district_capacity"].items():
+        assert sum(a["count"] for a in decomposed["allocations"] if a["district"] == d) <= limit
+    for vehicle in fleet:
+        sent = sum(a["count"] for a in decomposed["allocations"]
+                   if a["truck_class"] == vehicle["class"] and a["depot"] == vehicle["depot"])
+        assert sent <= vehicle["count"]
+
+def test_time_limited_mip_returns_incumbent_bound_and_gap(monkeypatch):
+    from optimize import mip_solver
+
+    state, vfa = next(_rolling_inputs(1, n_districts=40, seed=3))
+    constraints = {"district_capacity": {d: 1 for d in state}}
+    result = solve_allocation_mip(state, vfa, ROLLING_FLEET, constraints, method="mip",
+                                  time_limit_s=0.5, relative_gap=1e-3, reuse_session=False)
+    info = result["solve_info"]
+    assert info["status"] in ("optimal", "feasible")
+    assert info["bound"] <= result["objective"] + 1e-6
+    assert info["gap"] >= 0
+
+    # SCIP without an incumbent: the heuristic allocation comes back, not a placeholder
+    monkeypatch.setattr(mip_solver.MIPSession, "solve",
+                        lambda self, *args, **kwargs: (pywraplp.Solver.NOT_SOLVED, None, float("nan"), float("-inf")))
+    result = solve_allocation_mip(state, vfa, ROLLING_FLEET, constraints, method="mip", reuse_session=False)
+    info = result["solve_info"]
+    assert info["incumbent"] == "heuristic"
+    assert info["bound"] <= result["objective"] + 1e-6
+    assert result["objective"] < 0
+    assert all(sum(a["count"] for a in result["allocations"] if a["district"] == d) <= 1 for d in state)
+
+def test_road_network_is_shared_across_requests(tmp_path, monkeypatch):
+    import main
+    import simulate.routing as routing
+
+    path = tmp_path / "road_network.json"
+    graph = {"nodes": [{"id": "D000"}, {"id": "D001"}],
+             "edges": [{"u": "D000", "v": "D001", "travel_time_mean": 1.0}]}
+    path.write_text(json.dumps(graph))
+    monkeypatch.setattr(routing, "ROAD_NETWORK_JSON", str(path))
+    monkeypatch.setattr(main, "road_network", None)
+    monkeypatch.setattr(main, "road_network_version", None)
+
+    network = main.get_road_network()
+    network.all_pairs()
+    assert main.get_road_network() is network
+    assert len(network._cache) == 1
+
+    # A changed file is picked up
+    graph["edges"][0]["travel_time_mean"] = 2.0
+    path.write_text(json.dumps(graph) + " ")
+    assert main.get_road_network() is not network
+
+def test_optimize_rejects_invalid_time_limit():
+    response = client.post("/optimize", json={
+        "current_state": {"D001": {"inventory": 100, "backlog": 20, "demand_last_period": 15}},
+        "vfa_estimates": {"D001": -50.0},
+        "fleet": [{"class": "small_truck", "capacity": 100, "count": 5}],
+        "time_limit_s": 0
+    })
+    assert response.status_code == 400
+
+def test_optimize_batch_returns_results_in_order():
+    variants = list(_rolling_inputs(6, n_districts=20, seed=4))
+    requests_data = [
+        {"current_state": state, "vfa_estimates": vfa, "fleet": ROLLING_FLEET,
+         "constraints": {"district_capacity": {"D001": 1}} if k % 2 else {"lock_out": ["D001"]}}
+        for k, (state, vfa) in enumerate(variants)
+    ]
+    response = client.post("/optimize/batch", json={"requests": requests_data, "n_workers": 2})
+    assert response.status_code == 200
+
+    results = response.json()["results"]
+    assert [r["solve_info"]["method"] for r in results] == ["greedy", "mip"] * 3
+    for request_data, result in zip(requests_data, results):
+        single = solve_allocation_mip(request_data["current_state"], request_data["vfa_estimates"],
+                                      ROLLING_FLEET, request_data["constraints"])
+        assert result["objective"] == pytest.approx(single["objective"], rel=1e-3)
+
+    # Later batches reuse the service's pool rather than starting their own
+    import main
+    pool = main.optimize_pool
+    assert pool is not None
+    assert client.post("/optimize/batch", json={"requests": requests_data[:2]}).status_code == 200
+    assert main.optimize_pool is pool
+
+    mismatched = [requests_data[0], dict(requests_data[1], fleet=ROLLING_FLEET[:1])]
+    assert client.post("/optimize/batch", json={"requests": mismatched}).status_code == 400
+
+def test_demand_scenarios_follow_forecast_quantiles():
+    from optimize.stochastic import need_upper_bound, sample_demand_scenarios
+
+    forecasts = {
+        "D001": {"mean": 10.0, "var": 5.0, "quantiles": {"p10": 3.0, "p50": 10.0, "p90": 20.0}, "surge_prob": 0.0},
+        "D002": {"mean": 10.0, "var": 50.0, "surge_prob": 0.0},
+        "D003": {"mean": 10.0, "var": 5.0, "quantiles": {"p10": 3.0, "p50": 10.0, "p90": 20.0}, "surge_prob": 1.0}
+    }
+    demand = sample_demand_scenarios(forecasts, ["D001", "D002", "D003"], 20000)
+
+    assert np.percentile(demand[:, 0], [10, 50, 90]) == pytest.approx([3.0, 10.0, 20.0], rel=0.05)
+    assert demand[:, 1].mean() == pytest.approx(10.0, rel=0.05)
+    assert demand[:, 1].var() == pytest.approx(50.0, rel=0.1)
+    # Certain surge: every draw doubled
+    assert np.median(demand[:, 2]) == pytest.approx(20.0, rel=0.05)
+    # The surged tail knot of D003 bounds every quantile-sampled draw
+    assert need_upper_bound({d: forecasts[d] for d in ("D001", "D003")}, ["D001", "D003"]) == 45.0
+    assert demand[:, [0, 2]].max() <= 45.0
+
+def test_lattice_shortfall_cuts_are_exact_at_deliverable_capacities():
+    from optimize.stochastic import shortfall_cuts
+
+    need = np.random.default_rng(5).gamma(2, 30, (200, 4))
+    for step in (None, 10.0):
+        intercepts, slopes = shortfall_cuts(need, 5, step)
+        for c in range(0, 400, 10):
+            cut = np.max(np.where(intercepts > 0, intercepts - slopes * c, 0), axis=1)
+            np.testing.assert_allclose(np.maximum(cut, 0), 5 * np.maximum(need - c, 0).mean(axis=0), atol=1e-9)
+
+def test_scenario_count_follows_measured_throughput():
+    from optimize.stochastic import MAX_SCENARIOS, MIN_SCENARIOS, measure_throughput, scenarios_for_budget
+
+    throughput = measure_throughput()
+    assert throughput["draws_per_second"] > 0 and throughput["cuts_per_second"] > 0
+
+    slow = {"draws_per_second": 1e5, "cuts_per_second": 1e3}
+    assert scenarios_for_budget(100, 2.0, throughput=slow) == 20
+    assert scenarios_for_budget(100, 2.0, step=10.0, throughput=slow) == 200
+    assert scenarios_for_budget(100, 0.01, throughput=slow) == MIN_SCENARIOS
+    assert scenarios_for_budget(10, 2.0, step=10.0, throughput={**slow, "draws_per_second": 1e9}) == MAX_SCENARIOS
+    # Needs spanning more multiples of the step than the lattice takes: one cut per scenario
+    assert scenarios_for_budget(100, 2.0, step=10.0, throughput=slow, max_need=1000.0) == 200
+    assert scenarios_for_budget(100, 2.0, step=1.0, throughput=slow, max_need=1000.0) == 20
+
+def test_optimize_with_forecasts_uses_saa():
+    state, vfa = next(_rolling_inputs(1, n_districts=8, seed=6))
+    rng = np.random.default_rng(6)
+    forecasts = {}
+    for d in state:
+        mean = float(rng.gamma(2, 5))
+        forecasts[d] = {"mean": mean, "var": mean * 0.5, "surge_prob": float(rng.beta(1, 10)),
+                        "quantiles": {"p10": mean * 0.3, "p50": mean, "p90": mean * 2.0}}
+    response = client.post("/optimize", json={
+        "current_state": state, "vfa_estimates": vfa, "fleet": ROLLING_FLEET,
+        "constraints": {"lock_out": ["D002"]}, "forecasts": forecasts, "n_scenarios": 100
+    })
+    assert response.status_code == 200
+
+    data = response.json()
+    info = data["solve_info"]
+    assert info["method"] == "saa"
+    assert info["n_scenarios"] == 100 and info["seed"] == 0
+    assert info["expected_unmet"] >= 0
+    assert all(a["district"] != "D002" for a in data["allocations"])
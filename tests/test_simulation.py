@@ -0,0 +1,691 @@
+# tests/test_simulation.py
+import pytest
+import json
+import numpy as np
+import sys
+import os
+
+# Add ml_service to path
+sys.path.append(os.path.join(os.path.dirname(__file__), '..', 'ml_service'))
+
+from simulate.district_state import DistrictStateTable
+from simulate.events import limit_to_available
+from simulate.policies import POLICY_REGISTRY, VFA_FEATURES, Policy, VFAModelPolicy, register_policy, top_k_ranks
+from simulate.result_cache import RESULT_CACHE_DIR, ResultCache
+from simulate.results_writer import ResultWriter, read_results
+from simulate.simulation_engine import SimulationEngine, analyze_sensitivity, compare_policies, run_simulation
+from simulate.sweeps import apply_parameters, expand_design
+from simulate.routing import LOADING_HOURS, RoadNetwork, RoadState
+from simulate.scenarios import load_demand_tensor, demand_cache_path, load_flood_districts
+from utils.metrics import EpisodeSummary, RunningStats, TDigest, paired_difference_ci
+
+POLICIES = ["dl_vfa", "nn_vfa", "heuristic", "greedy", "round_robin"]
+
+@pytest.fixture
+def scenario_path(tmp_path):
+    scenario = {
+        "name": "test_surge",
+        "seed": 7,
+        "periods": 12,
+        "shock_times": [3, 4],
+        "shock_multipliers": {"districts": ["D001", "D002"], "mult": [3.5, 2.1]},
+        "road_failures": [{"time": 6, "edge": ["D003", "D004"]}]
+    }
+    path = tmp_path / "test_surge.json"
+    path.write_text(json.dumps(scenario))
+    return str(path)
+
+@pytest.mark.parametrize("policy", POLICIES)
+def test_batch_decisions_match_single_episode_decisions(scenario_path, policy):
+    engine = SimulationEngine(scenario_path)
+    trajectories = engine.generate_trajectories([0, 1, 2])
+
+    state = DistrictStateTable.from_columns(engine.district_ids, {
+        key: np.stack([t['initial_state'][key] for t in trajectories])
+        for key in DistrictStateTable.FIELDS
+    })
+    state.backlog[1] = [40.0, 5.0, 22.0, 0.0, 18.0]
+    demands = np.stack([t['demand'][3] for t in trajectories])
+    eta_noise = np.stack([t['eta_noise'][3] for t in trajectories])
+
+    counts, eta_hours = engine._make_batch_policy_decision(
+        state, demands, policy, 3, eta_noise, engine.vehicle_routes()
+    )
+
+    for episode in range(3):
+        single = engine._make_policy_decision(
+            state.episode(episode), dict(zip(engine.district_ids, demands[episode])), policy, 3,
+            eta_noise=eta_noise[episode]
+        )
+        batch = {
+            (engine.district_ids[i], engine.vehicle_classes[j]): (int(counts[episode, i, j]), eta_hours[episode, i, j])
+            for i, j in zip(*np.nonzero(counts[episode]))
+        }
+        assert batch == {(a['district'], a['truck_class']): (a['count'], a['eta_hours']) for a in single}
+
+def test_district_state_table_records_round_trip():
+    records = [
+        {"district_id": "D001", "inventory": 100, "demand_last_period": 12,
+         "backlog": 5, "avg_deprivation_time": 2, "road_access": "closed"},
+        {"district_id": "D002", "inventory": 40, "demand_last_period": 20,
+         "backlog": 30, "avg_deprivation_time": 4, "road_access": "open"}
+    ]
+    table = DistrictStateTable.from_records(records)
+
+    assert table.n_episodes == 1 and table.n_districts == 2
+    assert table.get("D002", "backlog") == 30
+    assert table.to_records() == [{**r, **{k: float(r[k]) for k in DistrictStateTable.FIELDS}} for r in records]
+
+def test_vectorized_simulate_policy(scenario_path):
+    engine = SimulationEngine(scenario_path)
+    summary, episodes = engine.simulate_policy("dl_vfa", 50, vectorized=True)
+
+    assert summary["episodes"] == 50
+    assert len(episodes) == 50
+    assert [e["episode"] for e in episodes] == list(range(50))
+    assert all(len(e["period_history"]) == 12 for e in episodes)
+    assert summary["demand_coverage"] > 0
+    assert summary["mean_cost"] > 0
+
+def test_vectorized_mode_is_reproducible(scenario_path):
+    first, _ = SimulationEngine(scenario_path).simulate_policy("heuristic", 20, vectorized=True)
+    second, _ = SimulationEngine(scenario_path).simulate_policy("heuristic", 20, vectorized=True)
+    assert first == second
+
+def test_parallel_episodes_match_serial(scenario_path):
+    engine = SimulationEngine(scenario_path)
+    serial_summary, serial = engine.simulate_policy("nn_vfa", 6)
+    parallel_summary, parallel = engine.simulate_policy("nn_vfa", 6, n_workers=2)
+
+    assert [e["episode"] for e in parallel] == list(range(6))
+    assert [e["total_cost"] for e in parallel] == [e["total_cost"] for e in serial]
+    assert parallel_summary == serial_summary
+
+@pytest.mark.parametrize("policy", ["dl_vfa", "heuristic"])
+def test_batch_episodes_match_serial_episodes(scenario_path, policy):
+    engine = SimulationEngine(scenario_path)
+    serial = [engine._run_episode(policy, episode) for episode in range(4)]
+    batch = engine._run_batch(policy, [0, 1, 2, 3])
+
+    for s, b in zip(serial, batch):
+        for key in ["total_cost", "mean_deprivation", "demand_coverage", "total_demand"]:
+            assert b[key] == pytest.approx(s[key])
+
+def test_single_episode_replays_from_its_reported_seed(scenario_path):
+    _, batch = SimulationEngine(scenario_path).simulate_policy("heuristic", 6, vectorized=True)
+    episode = batch[4]
+    assert [e["spawn_key"] for e in batch] == [[i] for i in range(6)]
+
+    engine = SimulationEngine(scenario_path)
+    assert episode["seed"] == engine.scenario["seed"]
+    replay = engine._run_episode("heuristic", *episode["spawn_key"])
+    assert replay["total_cost"] == pytest.approx(episode["total_cost"])
+    assert replay["total_demand"] == pytest.approx(episode["total_demand"])
+
+@pytest.mark.parametrize("output_format", ["parquet", "csv"])
+def test_result_writer_round_trip(scenario_path, tmp_path, output_format):
+    _, episodes = SimulationEngine(scenario_path).simulate_policy("greedy", 5, vectorized=True)
+    with ResultWriter("greedy", output_format, str(tmp_path), batch_size=2) as writer:
+        writer.write(episodes)
+
+    episode_table = read_results(writer.path).sort_values("episode")
+    period_table = read_results(writer.path, "periods")
+    assert writer.episodes_written == 5
+    assert "period_history" not in episode_table.columns
+    assert episode_table["total_cost"].tolist() == pytest.approx([e["total_cost"] for e in episodes])
+    assert len(period_table) == 5 * 12
+    assert period_table["cost"].sum() == pytest.approx(sum(e["total_cost"] for e in episodes))
+
+def test_run_simulation_streams_results(scenario_path, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    result = run_simulation(scenario_path, "heuristic", 6, n_workers=2, demand_cache_dir=None)
+
+    # Workers send back chunk summaries, merged here (equal up to rounding)
+    engine = SimulationEngine(scenario_path)
+    summary, _ = engine.simulate_policy("heuristic", 6)
+    assert result["results_summary"] == pytest.approx(summary)
+    episode_table = read_results(result["output_file"])
+    assert sorted(episode_table["episode"]) == list(range(6))
+    assert set(episode_table["policy"].astype(str)) == {"heuristic"}
+    assert len(read_results(result["output_file"], "periods")) == 6 * 12
+
+    # ... after storing their episodes in the result cache themselves
+    cached = ResultCache(RESULT_CACHE_DIR).load_episodes(engine.cache_key("heuristic"), list(range(6)))
+    assert sorted(cached) == list(range(6))
+
+@pytest.mark.parametrize("vectorized", [True, False])
+def test_result_cache_serves_overlapping_ranges(scenario_path, tmp_path, monkeypatch, vectorized):
+    cache = ResultCache(str(tmp_path / "results"))
+    engine = SimulationEngine(scenario_path)
+    engine.simulate_policy("greedy", 20, vectorized=vectorized, cache=cache)
+
+    simulated = []
+    run_batch = engine._run_batch
+    monkeypatch.setattr(engine, "_run_batch", lambda policy, episodes, *args: (
+        simulated.extend(episodes) or run_batch(policy, episodes, *args)))
+    summary, episodes = engine.simulate_policy("greedy", 50, vectorized=vectorized, cache=cache)
+
+    assert simulated == list(range(20, 50))
+    assert [e["episode"] for e in episodes] == list(range(50))
+    assert summary == SimulationEngine(scenario_path).simulate_policy("greedy", 50, vectorized=vectorized)[0]
+
+def test_result_cache_keys_on_scenario_contents(scenario_path, tmp_path):
+    engine = SimulationEngine(scenario_path)
+    copy_path = tmp_path / "renamed.json"
+    copy_path.write_text(open(scenario_path).read())
+    assert SimulationEngine(str(copy_path)).cache_key("greedy") == engine.cache_key("greedy")
+    assert engine.cache_key("heuristic") != engine.cache_key("greedy")
+
+    edited = json.loads(open(scenario_path).read())
+    edited["seed"] += 1
+    copy_path.write_text(json.dumps(edited))
+    assert SimulationEngine(str(copy_path)).cache_key("greedy") != engine.cache_key("greedy")
+
+def test_result_cache_evicts_least_recently_used(scenario_path, tmp_path):
+    cache = ResultCache(str(tmp_path / "results"))
+    engine = SimulationEngine(scenario_path)
+    _, episodes = engine.simulate_policy("greedy", 30, vectorized=True)
+    for start in (0, 10, 20):
+        cache.store_episodes("k", episodes[start:start + 10])
+
+    cache.load_episodes("k", [0])
+    cache.max_bytes = cache.size() - 1
+    cache.evict()
+    assert sorted(cache.load_episodes("k", list(range(30)))) == list(range(0, 10)) + list(range(20, 30))
+
+def test_run_simulation_reuses_cached_summary(scenario_path, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    first = run_simulation(scenario_path, "greedy", 8, demand_cache_dir=None)
+    second = run_simulation(scenario_path, "greedy", 8, demand_cache_dir=None)
+    assert second == first
+
+    longer = run_simulation(scenario_path, "greedy", 12, demand_cache_dir=None, result_cache_dir=None)
+    cached_longer = run_simulation(scenario_path, "greedy", 12, demand_cache_dir=None)
+    assert cached_longer["results_summary"] == longer["results_summary"]
+    assert cached_longer["output_file"] != first["output_file"]
+
+def test_demand_stream_is_shared_across_policies(scenario_path):
+    engine = SimulationEngine(scenario_path)
+    demand = {
+        policy: [e["total_demand"] for e in engine.simulate_policy(policy, 3)[1]]
+        for policy in ["dl_vfa", "greedy"]
+    }
+    assert demand["dl_vfa"] == demand["greedy"]
+
+def test_paired_difference_ci():
+    a = [10.0, 12.0, 15.0, 11.0, 20.0]
+    b = [9.0, 11.5, 13.0, 10.0, 19.0]
+    result = paired_difference_ci(a, b)
+
+    assert result["mean_diff"] == pytest.approx(1.1)
+    assert result["ci_low"] < 1.1 < result["ci_high"]
+    assert result["significant"]
+    assert result["variance_reduction"] > 1
+
+def test_running_stats_merge_matches_numpy():
+    values = np.random.default_rng(0).gamma(2.0, 50.0, 1001)
+    left, right = RunningStats(), RunningStats()
+    for v in values[:400]:
+        left.update(v)
+    right.update_batch(values[400:])
+    left.merge(right)
+
+    assert left.count == 1001
+    assert left.mean == pytest.approx(values.mean())
+    assert left.std() == pytest.approx(values.std())
+    assert left.variance(ddof=1) == pytest.approx(values.var(ddof=1))
+    assert (left.min, left.max) == (values.min(), values.max())
+
+def test_tdigest_quantiles():
+    rng = np.random.default_rng(1)
+    small = rng.normal(size=200)
+    digest = TDigest()
+    digest.update_batch(small)
+    for q in (0.1, 0.5, 0.9, 0.95):
+        assert digest.quantile(q) == pytest.approx(np.percentile(small, 100 * q))
+
+    # Compressed and merged from chunks, as from parallel workers
+    large = rng.lognormal(size=200_000)
+    merged = TDigest()
+    for chunk in np.array_split(large, 8):
+        part = TDigest()
+        for v in chunk[:500]:
+            part.update(v)
+        part.update_batch(chunk[500:])
+        merged.merge(part)
+    assert len(merged.means) <= merged.buffer_size
+    assert merged.count == len(large)
+    for q in (0.5, 0.9, 0.95, 0.99):
+        exact = np.percentile(large, 100 * q)
+        assert merged.quantile(q) == pytest.approx(exact, rel=0.01)
+
+def test_streaming_summary_matches_batch_statistics(scenario_path):
+    engine = SimulationEngine(scenario_path)
+    summary, episodes = engine.simulate_policy("heuristic", 30, vectorized=True)
+    costs = [e["total_cost"] for e in episodes]
+
+    assert summary["mean_cost"] == pytest.approx(np.mean(costs))
+    assert summary["std_cost"] == pytest.approx(np.std(costs))
+    assert summary["p90_cost"] == pytest.approx(np.percentile(costs, 90))
+    assert summary["min_coverage"] == min(e["demand_coverage"] for e in episodes)
+
+    halves = EpisodeSummary()
+    for part in (episodes[:10], episodes[10:]):
+        partial = EpisodeSummary()
+        for e in part:
+            partial.update(e)
+        halves.merge(partial)
+    assert halves.to_dict("heuristic", summary["scenario"]) == pytest.approx(summary)
+
+    _, kept = engine.simulate_policy("heuristic", 5, keep_results=False)
+    assert kept == []
+
+def test_paired_compare_policies(scenario_path, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    comparison = compare_policies(scenario_path, ["dl_vfa", "round_robin"], n_episodes=8, paired=True)
+
+    paired = comparison["paired_comparison"]
+    assert sorted(paired["ranking"]) == ["dl_vfa", "round_robin"]
+    assert paired["ranking"][0] == paired["baseline"]
+    assert len(paired["vs_baseline"]) == 1
+    assert len(paired["adjacent"]) == 1
+    assert comparison["policies"]["dl_vfa"]["episodes"] == 8
+    assert comparison["episodes_per_policy"] == {"dl_vfa": 8, "round_robin": 8}
+
+    unpaired = compare_policies(scenario_path, ["dl_vfa", "round_robin"], n_episodes=3)
+    assert unpaired["episodes_per_policy"] == {"dl_vfa": 3, "round_robin": 3}
+    with pytest.raises(ValueError):
+        compare_policies(scenario_path, ["dl_vfa"], n_episodes=2, paired=True, paired_metric="periods")
+
+def test_adaptive_run_stops_at_target_half_width(scenario_path, tmp_path):
+    engine = SimulationEngine(scenario_path)
+    summary, episodes = engine.simulate_policy("heuristic", 400, vectorized=True, target_half_width=50)
+
+    assert summary["target_reached"]
+    assert 20 <= summary["episodes"] < 400
+    assert summary["ci_half_width"] <= 50
+    assert len(episodes) == summary["episodes"]
+
+    parallel, _ = engine.simulate_policy("heuristic", 400, vectorized=True, target_half_width=50, n_workers=2)
+    assert parallel == summary
+    merged, kept = engine.simulate_policy("heuristic", 400, vectorized=True, target_half_width=50, n_workers=2,
+                                          keep_results=False)
+    assert kept == []
+    assert merged == pytest.approx(summary)
+
+    # Chunks still running at the stop are not added to the output
+    with ResultWriter("heuristic", output_dir=str(tmp_path)) as writer:
+        streamed, _ = engine.simulate_policy("heuristic", 400, vectorized=True, target_half_width=50,
+                                             n_workers=2, keep_results=False, writer=writer)
+    assert streamed == pytest.approx(summary)
+    assert len(read_results(writer.path)) == streamed["episodes"]
+    assert len(read_results(writer.path, "periods")) == streamed["episodes"] * 12
+    assert not [name for _, _, names in os.walk(writer.path) for name in names if not name.startswith("part")]
+
+    unreachable, _ = engine.simulate_policy("heuristic", 40, vectorized=True, target_half_width=1e-9)
+    assert unreachable["episodes"] == 40
+    assert not unreachable["target_reached"]
+
+def test_racing_drops_dominated_policies(scenario_path, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    policies = ["dl_vfa", "heuristic", "round_robin", "greedy"]
+    comparison = compare_policies(scenario_path, policies, n_episodes=300, vectorized=True,
+                                  race=True, demand_cache_dir=None)
+
+    racing = comparison["racing"]
+    assert racing["survivors"] == ["round_robin"]
+    assert {e["policy"] for e in racing["eliminated"]} == {"dl_vfa", "heuristic", "greedy"}
+    assert all(e["ci_low"] > 0 for e in racing["eliminated"])
+    assert racing["episodes_run"] < racing["episode_budget"]
+    assert comparison["paired_comparison"]["ranking"] == ["round_robin"]
+    assert sum(comparison["episodes_per_policy"].values()) == racing["episodes_run"]
+
+def test_racing_on_a_maximised_metric_keeps_the_best_policy(scenario_path, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    policies = ["dl_vfa", "heuristic", "round_robin", "greedy"]
+    comparison = compare_policies(scenario_path, policies, n_episodes=300, vectorized=True,
+                                  race=True, paired_metric="demand_coverage", demand_cache_dir=None)
+
+    paired = comparison["paired_comparison"]
+    coverage = {p: comparison["policies"][p]["demand_coverage"] for p in policies}
+    assert paired["higher_is_better"]
+    assert max(coverage, key=coverage.get) in comparison["racing"]["survivors"]
+    assert "round_robin" not in comparison["racing"]["survivors"]
+    assert all(e["ci_high"] < 0 for e in comparison["racing"]["eliminated"])
+
+def test_demand_tensor_cache(scenario_path, tmp_path):
+    engine = SimulationEngine(scenario_path)
+    cache_dir = str(tmp_path / "cache")
+
+    first = load_demand_tensor(engine.scenario, engine.district_ids, range(0, 6), cache_dir)
+    assert os.path.exists(demand_cache_path(cache_dir, engine.scenario, engine.district_ids, 0, 6))
+
+    second = load_demand_tensor(engine.scenario, engine.district_ids, range(0, 6), cache_dir)
+    assert isinstance(second, np.memmap)
+    assert np.array_equal(first, second)
+    assert first.shape == (6, 12, 5)
+
+    # Any episode's demand is the same whichever range it was generated in
+    subset = load_demand_tensor(engine.scenario, engine.district_ids, [2, 3], None)
+    assert np.array_equal(subset, first[2:4])
+
+def test_demand_cache_is_size_bounded(scenario_path, tmp_path):
+    engine = SimulationEngine(scenario_path)
+    cache_dir = str(tmp_path / "cache")
+    args = (engine.scenario, engine.district_ids)
+
+    first = load_demand_tensor(*args, range(0, 6), cache_dir)
+    # Room for one tensor: writing the second evicts the first
+    load_demand_tensor(*args, range(6, 12), cache_dir, max_bytes=first.nbytes + 1024)
+    assert not os.path.exists(demand_cache_path(cache_dir, *args, 0, 6))
+    assert os.path.exists(demand_cache_path(cache_dir, *args, 6, 12))
+    # A regenerated tensor is the same
+    assert np.array_equal(load_demand_tensor(*args, range(0, 6), cache_dir), first)
+
+def test_cached_demand_matches_uncached_run(scenario_path, tmp_path):
+    uncached, _ = SimulationEngine(scenario_path).simulate_policy("greedy", 5)
+    cached_engine = SimulationEngine(scenario_path, demand_cache_dir=str(tmp_path / "cache"))
+    cached, _ = cached_engine.simulate_policy("greedy", 5)
+    cached_again, _ = cached_engine.simulate_policy("greedy", 5)
+
+    assert cached == uncached
+    assert cached_again == uncached
+
+def test_load_flood_districts():
+    districts = load_flood_districts()
+
+    assert len(districts["district_ids"]) > 700
+    assert len(set(districts["district_ids"])) == len(districts["district_ids"])
+    assert districts["demand_scale"].mean() == pytest.approx(1.0)
+    assert (districts["demand_scale"] > 0).all()
+
+def test_flood_data_scenario(tmp_path):
+    scenario = {"name": "national", "seed": 3, "periods": 6, "districts": {"source": "flood_data", "limit": 40}}
+    path = tmp_path / "national.json"
+    path.write_text(json.dumps(scenario))
+
+    engine = SimulationEngine(str(path))
+    assert len(engine.district_ids) == 40
+    assert engine.district_names[0] == "Dadra & Nagar Haveli"
+
+    serial = engine._run_episode("dl_vfa", 0)
+    batch = engine._run_batch("dl_vfa", [0])[0]
+    assert batch["total_cost"] == pytest.approx(serial["total_cost"])
+    assert batch["total_demand"] == pytest.approx(serial["total_demand"])
+
+def test_road_network_shortest_paths(scenario_path):
+    engine = SimulationEngine(scenario_path)
+    roads = engine.roads
+
+    times = roads.all_pairs()
+    d001, d005 = roads.index["D001"], roads.index["D005"]
+    # D001 -> D004 -> D005 (0.6 + 0.4) beats D001 -> D002 -> D005 (0.5 + 0.9)
+    assert times[d001, d005] == pytest.approx(1.0)
+    assert roads.all_pairs() is times
+
+    open_mask = roads.all_open()
+    open_mask[roads.edges_between("D004", "D005")] = False
+    assert roads.all_pairs(open_mask)[d001, d005] == pytest.approx(1.4)
+
+    # Cut every road into D005: ground vehicles can no longer reach it
+    for neighbour in ["D004", "D002"]:
+        open_mask[roads.edges_between(neighbour, "D005")] = False
+    routes = engine.vehicle_routes(open_mask)
+    small_truck = engine.vehicle_classes.index("small_truck")
+    assert np.isinf(routes[engine.district_ids.index("D005"), small_truck])
+
+def test_fleet_entries_leave_from_their_own_depot(scenario_path):
+    roads = SimulationEngine(scenario_path).roads
+    fleet = [{"class": "small_truck", "depot": "D001"}, {"class": "small_truck", "depot": "D005"}]
+
+    table = roads.travel_time_table(fleet, ["D005"])
+    assert table["D005"]["small_truck@D001"] == pytest.approx(LOADING_HOURS + 1.0)
+    assert table["D005"]["small_truck@D005"] == pytest.approx(LOADING_HOURS)
+
+def test_policies_skip_unreachable_districts(scenario_path):
+    engine = SimulationEngine(scenario_path)
+    open_mask = engine.roads.all_open()
+    for neighbour in ["D004", "D002"]:
+        open_mask[engine.roads.edges_between(neighbour, "D005")] = False
+    routes = engine.vehicle_routes(open_mask)
+
+    state = engine._initialize_districts()
+    demands = np.zeros((1, len(engine.district_ids)))
+    demands[0, engine.district_ids.index("D005")] = 500.0
+    counts, eta_hours = engine._make_batch_policy_decision(
+        state, demands, "greedy", 0, np.full((1, len(engine.district_ids)), 0.5), routes
+    )
+
+    assert counts[0, engine.district_ids.index("D005")].sum() == 0
+    assert np.all(np.isfinite(eta_hours))
+
+def test_incremental_routes_match_full_recomputation():
+    rng = np.random.default_rng(0)
+    n_nodes = 40
+    edges = [{"u": f"N{i}", "v": f"N{i + 1}", "travel_time_mean": float(rng.uniform(0.2, 1.0))}
+             for i in range(n_nodes - 1)]
+    edges += [{"u": f"N{u}", "v": f"N{v}", "travel_time_mean": float(rng.uniform(0.2, 2.0))}
+              for u, v in rng.integers(0, n_nodes, (60, 2)) if u != v]
+    roads = RoadNetwork({"nodes": [{"id": f"N{i}"} for i in range(n_nodes)], "edges": edges})
+
+    open_mask = roads.all_open()
+    roads.all_pairs(open_mask)
+    for _ in range(20):
+        open_mask = open_mask.copy()
+        flip = rng.choice(roads.n_edges, 3, replace=False)
+        open_mask[flip] = ~open_mask[flip]
+        np.testing.assert_allclose(roads.all_pairs(open_mask), roads._shortest_paths(open_mask))
+
+def test_scheduled_failures_are_indexed_by_period(tmp_path):
+    scenario = {"seed": 1, "periods": 6,
+                "road_failures": [{"time": 2, "edge": ["D004", "D003"], "duration": 2}]}
+    path = tmp_path / "closure.json"
+    path.write_text(json.dumps(scenario))
+    engine = SimulationEngine(str(path))
+    edge = engine.roads.edges_between("D003", "D004")[0]
+
+    assert engine.failure_schedule == {2: [edge]}
+    assert engine.reopen_schedule == {4: [edge]}
+
+    engine.update_road_failures(2)
+    assert not engine.road_state.status[0, edge]
+    engine.update_road_failures(4)
+    assert engine.road_state.status[0, edge]
+
+def test_road_failures_are_isolated_per_episode(tmp_path):
+    scenario = {"seed": 5, "periods": 12, "stochastic_road_failures": True,
+                "road_failures": [{"time": 1, "edge": ["D001", "D004"]}]}
+    path = tmp_path / "failures.json"
+    path.write_text(json.dumps(scenario))
+    engine = SimulationEngine(str(path))
+
+    first = engine._run_episode("greedy", 3)
+    batch = engine._run_batch("greedy", [0, 1, 2, 3])
+    again = engine._run_episode("greedy", 3)
+
+    assert first == again == batch[3]
+    assert engine.road_state.status.all()
+
+def test_road_state_snapshot_restore(scenario_path):
+    engine = SimulationEngine(scenario_path)
+    roads = RoadState(engine.roads, n_episodes=3)
+    roads.status[1, 2] = False
+    snapshot = roads.snapshot()
+
+    roads.status[:] = False
+    roads.restore(snapshot)
+    assert not roads.status[1, 2] and roads.status.sum() == roads.status.size - 1
+
+    roads.reset()
+    assert roads.status.all()
+    assert snapshot.nbytes == 3
+
+def test_top_k_ranks_match_full_sort():
+    score = np.random.default_rng(2).normal(size=(6, 30))
+    full_ranks = np.argsort(np.argsort(-score, axis=1, kind='stable'), axis=1)
+
+    for k in [0, 1, 5, 30, 40]:
+        expected = np.where(full_ranks < k, full_ranks, 30)
+        np.testing.assert_array_equal(top_k_ranks(score, k), expected)
+
+def test_registered_policy_runs_in_engine(scenario_path):
+    @register_policy("large_truck_to_worst")
+    class LargeTruckToWorst(Policy):
+        def decide(self, state, demands, period, eta_noise, routes=None):
+            counts, eta_hours = self.empty_allocation(demands)
+            mask = top_k_ranks(state.backlog + demands, 1) == 0
+            self.assign(counts, eta_hours, mask, "large_truck", 1, 2.0, 3.0, eta_noise, routes)
+            return counts, eta_hours
+
+    try:
+        summary, _ = SimulationEngine(scenario_path).simulate_policy("large_truck_to_worst", 3, vectorized=True)
+        assert summary["episodes"] == 3
+        assert summary["mean_cost"] > 0
+    finally:
+        del POLICY_REGISTRY["large_truck_to_worst"]
+
+    with pytest.raises(ValueError):
+        SimulationEngine(scenario_path).simulate_policy("large_truck_to_worst", 1)
+
+@pytest.fixture
+def ridge_vfa_path(tmp_path):
+    from sklearn.linear_model import Ridge
+    from sklearn.preprocessing import StandardScaler
+    import joblib
+
+    rng = np.random.default_rng(0)
+    X = rng.uniform(0, 200, (400, len(VFA_FEATURES)))
+    y = X[:, 1] * 10 + X[:, 2] * 50 + X[:, 4] * 5
+    scaler = StandardScaler().fit(X)
+    path = tmp_path / "dl_vfa.pkl"
+    joblib.dump({"model": Ridge().fit(scaler.transform(X), y), "scaler": scaler,
+                 "feature_names": VFA_FEATURES}, path)
+    return str(path)
+
+@pytest.mark.parametrize("n_districts", [None, 1])
+def test_vfa_candidate_features_match_direct_computation(scenario_path, ridge_vfa_path, n_districts):
+    engine = SimulationEngine(scenario_path)
+    policy = VFAModelPolicy(engine.fleet, model_path=ridge_vfa_path)
+    trajectories = engine.generate_trajectories([0, 1])
+    district_ids = engine.district_ids[:n_districts]
+    state = DistrictStateTable.from_columns(district_ids, {
+        key: np.stack([t['initial_state'][key][:len(district_ids)] for t in trajectories])
+        for key in DistrictStateTable.FIELDS
+    })
+    demands = np.stack([t['demand'][0][:len(district_ids)] for t in trajectories])
+
+    features = policy.candidate_features(state, demands)
+
+    for episode in range(2):
+        for candidate in range(len(district_ids) + 1):
+            backlog = state.backlog[episode] + demands[episode]
+            inventory = state.inventory[episode].copy()
+            if candidate > 0:
+                served = min(backlog[candidate - 1], policy.capacity)
+                backlog[candidate - 1] -= served
+                inventory[candidate - 1] += policy.capacity - served
+            adt = state.avg_deprivation_time[episode]
+            deprivation = np.where(backlog > 0, adt + 1, np.maximum(0, adt - 0.5))
+            expected = [inventory.sum(), backlog.sum(), deprivation.max(), 0.1, inventory.std(),
+                        (backlog > 20).sum(), (inventory > 100).sum(), deprivation.mean()]
+            np.testing.assert_allclose(features[episode, candidate], expected)
+
+def test_vfa_model_policy_predicts_once_per_decision(scenario_path, ridge_vfa_path):
+    @register_policy("test_vfa_model")
+    class TestVFAPolicy(VFAModelPolicy):
+        model_path = ridge_vfa_path
+
+    engine = SimulationEngine(scenario_path)
+    try:
+        policy = engine.get_policy("test_vfa_model")
+        calls = []
+        predict = policy.model.predict
+        policy.model.predict = lambda X: calls.append(len(X)) or predict(X)
+
+        summary, _ = engine.simulate_policy("test_vfa_model", 4, vectorized=True)
+    finally:
+        del POLICY_REGISTRY["test_vfa_model"]
+
+    periods = engine.scenario["periods"]
+    assert calls == [4 * (len(engine.district_ids) + 1)] * periods
+    assert summary["mean_cost"] > 0
+
+def test_event_engine_matches_period_loop_when_trips_fit_in_a_period(tmp_path):
+    # With 10-hour periods every shipment arrives and every vehicle is back
+    # within its period, so the event core must reproduce the period loop
+    scenario = {"seed": 7, "periods": 16, "period_hours": 10, "shock_times": [3],
+                "shock_multipliers": {"districts": ["D001"], "mult": [3.0]},
+                "road_failures": [{"time": 6, "edge": ["D003", "D004"], "duration": 4}],
+                "stochastic_road_failures": True}
+    period_path, event_path = tmp_path / "period.json", tmp_path / "event.json"
+    period_path.write_text(json.dumps(scenario))
+    event_path.write_text(json.dumps(dict(scenario, event_driven=True)))
+
+    for policy in POLICIES:
+        period_results = SimulationEngine(str(period_path))._run_batch(policy, [0, 1, 2])
+        event_results = SimulationEngine(str(event_path))._run_batch(policy, [0, 1, 2])
+        for expected, actual in zip(period_results, event_results):
+            for key in ["total_cost", "satisfied_demand", "mean_deprivation", "max_deprivation"]:
+                assert actual[key] == pytest.approx(expected[key]), (policy, key)
+
+def test_event_engine_keeps_vehicles_busy_until_return(tmp_path):
+    scenario = {"seed": 2, "periods": 4 * 24 * 7, "period_hours": 0.25,
+                "time_step_minutes": 15, "event_driven": True}
+    path = tmp_path / "fine.json"
+    path.write_text(json.dumps(scenario))
+    engine = SimulationEngine(str(path))
+
+    result = engine._run_episode("greedy", 0)
+    allocations = np.array([h["allocations"] for h in result["period_history"]])
+
+    # Greedy asks for pairs of small trucks (5 in the fleet: 2 + 2 + 1) and
+    # round trips take at least an hour (4 periods), so no hour can see more
+    # than three dispatches
+    assert len(allocations) == 4 * 24 * 7
+    assert np.convolve(allocations, np.ones(4, dtype=int), mode='valid').max() <= 3
+
+def test_limit_to_available_serves_neediest_first():
+    counts = np.array([[2, 0], [2, 1], [2, 0]])
+    limited = limit_to_available(counts, np.array([3, 1]), need=np.array([5.0, 1.0, 9.0]))
+    np.testing.assert_array_equal(limited, [[1, 0], [0, 1], [2, 0]])
+
+def test_expand_design():
+    variations = {"periods": [12, 24], "failure_prob_scale": {"low": 0.0, "high": 2.0}}
+    grid = expand_design(variations)
+    assert len(grid) == 6
+    assert {p["failure_prob_scale"] for p in grid} == {0.0, 1.0, 2.0}
+
+    for design in ("lhs", "sobol"):
+        points = expand_design(variations, design, n_samples=16, seed=3)
+        assert len(points) == 16
+        assert {p["periods"] for p in points} == {12, 24}
+        assert all(0.0 <= p["failure_prob_scale"] <= 2.0 for p in points)
+
+    # Latin hypercube: one sample in each of the 16 strata
+    scales = sorted(p["failure_prob_scale"] for p in expand_design(variations, "lhs", n_samples=16))
+    assert [int(v / 2.0 * 16) for v in scales] == list(range(16))
+
+def test_apply_parameters(tmp_path):
+    base = {"periods": 12, "shock_multipliers": {"districts": ["D001"], "mult": [3.5]}}
+    scenario = apply_parameters(base, {"shock_multipliers.mult.0": 2.0, "fleet.small_truck.count": 1})
+    assert scenario["shock_multipliers"]["mult"] == [2.0]
+    assert scenario["fleet"] == {"small_truck": {"count": 1}}
+    assert base["shock_multipliers"]["mult"] == [3.5]
+
+    path = tmp_path / "variant.json"
+    path.write_text(json.dumps(scenario))
+    fleet = {v["class"]: v["count"] for v in SimulationEngine(str(path)).fleet}
+    assert fleet["small_truck"] == 1
+    assert fleet["large_truck"] == 3
+
+def test_analyze_sensitivity(scenario_path, tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    variations = {"failure_prob_scale": [0.0, 20.0], "shock_multipliers.mult.0": [1.0, 5.0]}
+    result = analyze_sensitivity(scenario_path, variations, policy="heuristic", n_episodes=6, n_workers=2)
+
+    assert [row["variant"] for row in result["variants"]] == [0, 1, 2, 3]
+    assert result["variants"][3]["failure_prob_scale"] == 20.0
+    assert all(row["episodes"] == 6 for row in result["variants"])
+    # Failure probabilities do not change demand, so 4 variants share 2 demand tensors
+    assert len(os.listdir(tmp_path / "artifacts" / "cache" / "demand")) == 2
+    assert len(read_results(result["output_file"])) == 4